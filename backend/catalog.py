@@ -0,0 +1,66 @@
+import json, math, hashlib
+
+from starlette.responses import Response
+
+# Pre-encoded JSON for /assets and /metadata.
+#
+# Both endpoints are answered from bytes built off the price board, so a request never touches
+# SQLite. An entry is only re-encoded when the board slots it depends on have moved (their seq is
+# the version), and the ETag is a hash of the bytes so every worker hands out the same one.
+
+class CatalogEntry:
+    def __init__(self, version, body: bytes):
+        self.version = version
+        self.body = body
+        self.etag = f'"{hashlib.blake2b(body, digest_size=12).hexdigest()}"'
+
+class Catalog:
+    def __init__(self):
+        self.assets_entry = None
+        self.metadata_entries = {} # (asset_id, pair) -> CatalogEntry
+
+    def assets(self, programs: list, programs_version: float, board) -> CatalogEntry:
+        """The program list with handlers as their dotted names and prices from the board."""
+        versions = tuple(board.version(program['asset_id'], f'{program["symbolA"]}-{program["symbolB"]}') for program in programs)
+        version = (programs_version, board.generation, versions)
+        if self.assets_entry is not None and self.assets_entry.version == version:return self.assets_entry
+
+        encoded = []
+        for program in programs:
+            program = dict(program)
+            if callable(program['handler']):program['handler'] = f'{program["handler"].__module__}.{program["handler"].__name__}'
+            board_entry = board.read(program['asset_id'], f'{program["symbolA"]}-{program["symbolB"]}')
+            if board_entry is not None and board_entry['updated'] > 0:program['price'] = board_entry['price']
+            encoded.append(program)
+
+        self.assets_entry = CatalogEntry(version, json.dumps(encoded).encode('utf-8'))
+        return self.assets_entry
+
+    def metadata(self, asset_id: int, pair: str, board) -> CatalogEntry:
+        """Last price, last update and the 24h high/low/tick count of a series."""
+        # The ingestion republishes the 24h stats every minute, so the slot version covers their expiry too.
+        version = (board.version(asset_id, pair), board.generation)
+        entry = self.metadata_entries.get((asset_id, pair))
+        if entry is not None and entry.version == version:return entry
+
+        value = {'pair': pair, 'blockchain': 'solana', 'price': None, 'updated': None, 'high_24h': None, 'low_24h': None, 'ticks_24h': 0}
+        board_entry = board.read(asset_id, pair)
+        if board_entry is not None and board_entry['updated'] > 0:
+            value['price'] = board_entry['price']
+            value['updated'] = board_entry['updated']
+
+            # NaN when the series saw nothing in the last 24h.
+            if not math.isnan(board_entry['high_24h']):
+                value['high_24h'] = board_entry['high_24h']
+                value['low_24h'] = board_entry['low_24h']
+                value['ticks_24h'] = board_entry['ticks_24h']
+
+        entry = CatalogEntry(version, json.dumps(value).encode('utf-8'))
+        self.metadata_entries[(asset_id, pair)] = entry
+        return entry
+
+def entry_response(entry: CatalogEntry, if_none_match: str | None) -> Response:
+    headers = {'ETag': entry.etag, 'Cache-Control': 'no-cache'}
+    if if_none_match is not None and entry.etag in [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]:
+        return Response(status_code=304, headers=headers)
+    return Response(entry.body, headers=headers, media_type='application/json')
@@ -0,0 +1,235 @@
+import os, time, sqlite3, traceback, itertools
+from datetime import datetime, timezone
+
+# Historical bars partitioned by month.
+#
+# Every calendar month (UTC) gets its own SQLite file holding the same historical_prices_* tables
+# the single prices_historical.db used to have. A small catalog database lists the partitions and
+# their time range, so reads only open the files that overlap the requested range and the rollup
+# only ever writes to the newest ones. Once a month is over (plus a grace period for late bars)
+# its partition is compacted and turned read-only.
+
+COLD_AFTER = 60*60 # seconds after the end of a month before its partition goes cold
+CATALOG_REFRESH_SECONDS = 5
+
+def month_bounds(timestamp: int) -> tuple[str, int, int]:
+    """Partition name and [start, end) in ms for the month containing timestamp (ms)."""
+    date = datetime.fromtimestamp(timestamp / 1000, timezone.utc)
+    start = datetime(date.year, date.month, 1, tzinfo=timezone.utc)
+    end = datetime(date.year + (date.month == 12), date.month % 12 + 1, 1, tzinfo=timezone.utc)
+    return f'{date.year:04d}_{date.month:02d}', int(start.timestamp() * 1000), int(end.timestamp() * 1000)
+
+def create_table(conn: sqlite3.Connection, table: str, index: bool = True):
+    conn.execute(f'CREATE TABLE IF NOT EXISTS {table} (pair TEXT, high REAL, low REAL, open REAL, close REAL, timestamp INTEGER, ticks INTEGER)')
+    if index:create_index(conn, table)
+    # Tables written before bars carried their tick count get the column, their older bars keep NULL.
+    if 'ticks' not in [column[1] for column in conn.execute(f'PRAGMA table_info({table})')]:
+        conn.execute(f'ALTER TABLE {table} ADD COLUMN ticks INTEGER')
+
+def create_index(conn: sqlite3.Connection, table: str):
+    suffix = table.split('historical_prices_', 1)[1]
+    conn.execute(f'CREATE INDEX IF NOT EXISTS idx_timestamp_{suffix} ON {table}(timestamp)')
+
+def missing_column(error: sqlite3.OperationalError) -> bool:
+    # Read-only months written before a column was added do not have it.
+    return str(error).startswith('no such column')
+
+def missing_table(error: sqlite3.OperationalError) -> bool:
+    # A pair added after a month was written has no table there, anything else (locked, I/O, corrupt) is a real error.
+    return str(error).startswith('no such table')
+
+class HistoricalStore:
+    def __init__(self, directory: str = 'historical'):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+        self.partitions = [] # (name, start, end, state) sorted by start
+        self.last_refresh = 0
+        self.writers = {} # name -> connection, writer side only
+        self.created_tables = {} # name -> set of tables known to exist
+        self.freezing = set() # partitions being compacted in an executor, closed to writes
+        self.refresh()
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory, f'prices_historical_{name}.db')
+
+    def catalog(self) -> sqlite3.Connection:
+        # Short lived on purpose, the store is created before uvicorn and the ingestion process fork.
+        conn = sqlite3.connect(os.path.join(self.directory, 'catalog.db'))
+        conn.execute('CREATE TABLE IF NOT EXISTS partitions (name TEXT PRIMARY KEY, start INTEGER, end INTEGER, state TEXT)')
+        return conn
+
+    def refresh(self, force: bool = False):
+        if not force and time.time() - self.last_refresh < CATALOG_REFRESH_SECONDS:return
+        conn = self.catalog()
+        self.partitions = conn.execute('SELECT name, start, end, state FROM partitions ORDER BY start ASC').fetchall()
+        conn.close()
+        self.last_refresh = time.time()
+
+    def set_state(self, name: str, start: int, end: int, state: str):
+        conn = self.catalog()
+        conn.execute('INSERT INTO partitions (name, start, end, state) VALUES (?, ?, ?, ?) ON CONFLICT(name) DO UPDATE SET state = excluded.state', (name, start, end, state))
+        conn.commit()
+        conn.close()
+        self.refresh(force=True)
+
+    def overlapping(self, from_timestamp: int, to_timestamp: int) -> list:
+        """Partitions that overlap [from, to) in ms, oldest first."""
+        self.refresh()
+        return [partition for partition in self.partitions if partition[1] < to_timestamp and partition[2] > from_timestamp]
+
+    # Reader side.
+    def reader(self, partition) -> sqlite3.Connection:
+        name, _, _, state = partition
+        if state == 'cold':
+            return sqlite3.connect(f'file:{self.path(name)}?mode=ro&immutable=1', uri=True)
+        return sqlite3.connect(f'file:{self.path(name)}?mode=ro', uri=True)
+
+    def select(self, table: str, columns: str, from_timestamp: int, to_timestamp: int, inclusive: bool = False) -> list:
+        """Rows of `columns` with from < timestamp < to (from <= timestamp when inclusive), in timestamp order across partitions."""
+        lower = '>=' if inclusive else '>'
+        rows = []
+        for partition in self.overlapping(from_timestamp, to_timestamp):
+            conn = None
+            try:
+                conn = self.reader(partition)
+                rows.extend(conn.execute(f'SELECT {columns} FROM {table} WHERE timestamp {lower} ? AND timestamp < ? ORDER BY timestamp ASC', (from_timestamp, to_timestamp)))
+            except sqlite3.OperationalError as e:
+                if not missing_table(e):raise
+            finally:
+                if conn is not None:conn.close()
+        return rows
+
+    def last(self, table: str, columns: str):
+        """The newest row of a table across all partitions, or None."""
+        self.refresh()
+        for partition in reversed(self.partitions):
+            conn = None
+            try:
+                conn = self.reader(partition)
+                row = conn.execute(f'SELECT {columns} FROM {table} ORDER BY timestamp DESC LIMIT 1').fetchone()
+                if row is not None:return row
+            except sqlite3.OperationalError as e:
+                if not missing_table(e):raise
+            finally:
+                if conn is not None:conn.close()
+        return None
+
+    # Writer side, only used by the ingestion.
+    def writer(self, timestamp: int) -> tuple[str, sqlite3.Connection | None]:
+        """Connection to the partition holding timestamp (ms), registering the partition if it is new. None if it is cold."""
+        name, start, end = month_bounds(timestamp)
+        if name in self.writers:return name, self.writers[name]
+
+        self.refresh(force=True)
+        known = {partition[0]: partition[3] for partition in self.partitions}
+        if known.get(name) == 'cold' or name in self.freezing:return name, None
+
+        conn = sqlite3.connect(self.path(name))
+        conn.execute('PRAGMA journal_mode=WAL') # readers in the workers never block the rollup
+        if name not in known:self.set_state(name, start, end, 'active')
+
+        self.writers[name] = conn
+        self.created_tables[name] = set()
+        return name, conn
+
+    def ensure_table(self, name: str, conn: sqlite3.Connection, table: str):
+        if table in self.created_tables[name]:return
+        create_table(conn, table)
+        self.created_tables[name].add(table)
+
+    def create_tables(self, tables: list[str]):
+        """Create the tables in the current partition so readers find them before the first rollup."""
+        name, conn = self.writer(int(time.time() * 1000))
+        for table in tables:self.ensure_table(name, conn, table)
+        conn.commit()
+
+    def upsert_bars(self, table: str, bars: list[dict]):
+        """Merge rolled up bars into their partitions, keeping the existing open/close like the single database did and adding up the ticks."""
+        for bar in bars:
+            name, conn = self.writer(bar['timestamp'])
+            if conn is None:
+                print(f'Dropping a late bar for {table} at {bar["timestamp"]}, partition {name} is read-only.')
+                continue
+            self.ensure_table(name, conn, table)
+
+            fetch_result = conn.execute(f'SELECT pair, high, low, open, close, timestamp, ticks FROM {table} WHERE timestamp = ?', (bar['timestamp'],)).fetchone()
+            if fetch_result is not None:
+                bar['high'] = max(bar['high'], fetch_result[1])
+                bar['low'] = min(bar['low'], fetch_result[2])
+                bar['open'] = fetch_result[3]
+                bar['close'] = fetch_result[4]
+                bar['ticks'] += fetch_result[6] or 0
+                conn.execute(f'UPDATE {table} SET high = ?, low = ?, open = ?, close = ?, ticks = ? WHERE timestamp = ?', (bar['high'], bar['low'], bar['open'], bar['close'], bar['ticks'], bar['timestamp']))
+            else:
+                conn.execute(f'INSERT INTO {table} (pair, high, low, open, close, timestamp, ticks) VALUES (?, ?, ?, ?, ?, ?, ?)', (bar['pair'], bar['high'], bar['low'], bar['open'], bar['close'], bar['timestamp'], bar['ticks']))
+
+        for conn in self.writers.values():conn.commit()
+
+    def start_freezing(self) -> list:
+        """Close writes to every active partition whose month ended more than COLD_AFTER ago, returns (name, start, end) for freeze()."""
+        self.refresh(force=True)
+        now = int(time.time() * 1000)
+        names = []
+        for name, start, end, state in self.partitions:
+            if state != 'active' or end + COLD_AFTER*1000 > now or name in self.freezing:continue
+            self.freezing.add(name)
+            conn = self.writers.pop(name, None)
+            if conn is not None:conn.close()
+            self.created_tables.pop(name, None)
+            names.append((name, start, end))
+        return names
+
+    def freeze(self, name: str, start: int, end: int):
+        """Compact a partition and make it read-only. Slow, the ingestion runs it in an executor."""
+        try:
+            conn = sqlite3.connect(self.path(name))
+            conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+            conn.execute('PRAGMA journal_mode=DELETE')
+            conn.execute('VACUUM')
+            conn.close()
+            os.chmod(self.path(name), 0o444)
+
+            self.set_state(name, start, end, 'cold')
+            print(f'Historical partition {name} is now cold.')
+        except Exception:
+            traceback.print_exc()
+        finally:
+            self.freezing.discard(name)
+
+    def migrate_legacy(self, path: str):
+        """Split a single prices_historical.db into monthly partitions, then set it aside.
+
+        Months are written to .migrating files first and only renamed into place and added to the
+        catalog once all of them are complete, so a crash at any point just means starting over.
+        """
+        if not os.path.exists(path):return
+
+        print(f'Migrating {path} into monthly partitions...')
+        for leftover in os.listdir(self.directory):
+            if leftover.endswith('.migrating'):os.remove(os.path.join(self.directory, leftover))
+
+        legacy = sqlite3.connect(path)
+        tables = [row[0] for row in legacy.execute("SELECT name FROM sqlite_master WHERE type='table' AND name LIKE 'historical_prices_%'")]
+        partitions = {} # name -> (start, end, connection)
+        for table in tables:
+            # Rows come in timestamp order, so each month is one bulk insert, indexed once it is loaded.
+            rows = legacy.execute(f'SELECT pair, high, low, open, close, timestamp FROM {table} ORDER BY timestamp ASC')
+            for (name, start, end), month in itertools.groupby(rows, key=lambda row: month_bounds(row[5])):
+                if name not in partitions:partitions[name] = (start, end, sqlite3.connect(f'{self.path(name)}.migrating'))
+                conn = partitions[name][2]
+                create_table(conn, table, index=False)
+                conn.executemany(f'INSERT INTO {table} (pair, high, low, open, close, timestamp) VALUES (?, ?, ?, ?, ?, ?)', month)
+                create_index(conn, table)
+                conn.commit()
+        legacy.close()
+
+        self.refresh(force=True)
+        known = {partition[0] for partition in self.partitions}
+        for name, (start, end, conn) in partitions.items():
+            conn.close()
+            os.replace(f'{self.path(name)}.migrating', self.path(name)) # a rerun after a crash replaces what it renamed before
+            if name not in known:self.set_state(name, start, end, 'active')
+
+        os.rename(path, f'{path}.migrated')
+        print(f'Migrated {len(tables)} tables into {len(partitions)} months, the old file was kept as {path}.migrated')
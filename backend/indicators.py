@@ -0,0 +1,304 @@
+import time, bisect, sqlite3
+from collections import deque
+
+# Server-side indicators over bar closes.
+#
+# Every indicator keeps O(1) rolling state. update() commits a closed bar, preview() gives the
+# value for the still-open bar without touching the state, so the live bar can change as often
+# as it likes and each series is only ever computed once per process, not once per client.
+
+MAX_PERIOD = 1000
+CACHE_WINDOW = 60*60*24*31 # longest history a cached series is extended to, older ranges are computed per request
+MAX_CACHED_BARS = CACHE_WINDOW // 60 + 3*MAX_PERIOD # a month of 1m bars plus warmup
+WARM_WINDOW = 60*60*24 # seconds of history a subscribed series is built with, covers the chart's default ranges
+MAX_SERIES = 512
+MAX_TOTAL_BARS = 1_000_000 # committed bars across all cached series, roughly 100-200 MB
+IDLE_SECONDS = 60*30
+
+class SMA:
+    def __init__(self, period: int = 20):
+        self.period = period
+        self.warmup = period
+        self.window = deque()
+        self.total = 0.0
+
+    def preview(self, close: float):
+        if len(self.window) + 1 < self.period:return None
+        dropped = self.window[0] if len(self.window) == self.period else 0
+        return (self.total + close - dropped) / self.period
+
+    def update(self, close: float):
+        value = self.preview(close)
+        self.window.append(close)
+        self.total += close
+        if len(self.window) > self.period:self.total -= self.window.popleft()
+        return value
+
+class EMA:
+    def __init__(self, period: int = 20):
+        self.period = period
+        self.warmup = period * 3
+        self.alpha = 2 / (period + 1)
+        self.count = 0
+        self.total = 0.0 # seeds the EMA with the SMA of the first period closes
+        self.ema = None
+
+    def preview(self, close: float):
+        if self.ema is not None:return self.ema + self.alpha * (close - self.ema)
+        if self.count + 1 < self.period:return None
+        return (self.total + close) / self.period
+
+    def update(self, close: float):
+        value = self.preview(close)
+        if self.ema is None:
+            self.count += 1
+            self.total += close
+        self.ema = value
+        return value
+
+class RSI:
+    """Wilder's RSI."""
+
+    def __init__(self, period: int = 14):
+        self.period = period
+        self.warmup = period * 3
+        self.previous_close = None
+        self.count = 0
+        self.gain_total = 0.0
+        self.loss_total = 0.0
+        self.average_gain = None
+        self.average_loss = None
+
+    def averages(self, close: float):
+        change = close - self.previous_close
+        gain, loss = max(change, 0), max(-change, 0)
+        if self.average_gain is not None:
+            return (self.average_gain * (self.period - 1) + gain) / self.period, (self.average_loss * (self.period - 1) + loss) / self.period
+        if self.count + 1 < self.period:return None
+        return (self.gain_total + gain) / self.period, (self.loss_total + loss) / self.period
+
+    def preview(self, close: float):
+        if self.previous_close is None:return None
+        averages = self.averages(close)
+        if averages is None:return None
+        average_gain, average_loss = averages
+        if average_loss == 0:return 100.0
+        return 100 - 100 / (1 + average_gain / average_loss)
+
+    def update(self, close: float):
+        value = self.preview(close)
+        if self.previous_close is not None:
+            averages = self.averages(close)
+            if averages is not None:
+                self.average_gain, self.average_loss = averages
+            else:
+                change = close - self.previous_close
+                self.count += 1
+                self.gain_total += max(change, 0)
+                self.loss_total += max(-change, 0)
+        self.previous_close = close
+        return value
+
+class MACD:
+    """MACD line, signal line and histogram."""
+
+    def __init__(self, fast: int = 12, slow: int = 26, signal: int = 9):
+        self.fast = EMA(fast)
+        self.slow = EMA(slow)
+        self.signal = EMA(signal)
+        self.warmup = (max(fast, slow) + signal) * 3
+
+    @staticmethod
+    def combine(macd, signal):
+        if macd is None:return None
+        return [macd, signal, macd - signal if signal is not None else None]
+
+    def preview(self, close: float):
+        fast, slow = self.fast.preview(close), self.slow.preview(close)
+        if fast is None or slow is None:return None
+        return self.combine(fast - slow, self.signal.preview(fast - slow))
+
+    def update(self, close: float):
+        fast, slow = self.fast.update(close), self.slow.update(close)
+        if fast is None or slow is None:return None
+        return self.combine(fast - slow, self.signal.update(fast - slow))
+
+class Bollinger:
+    """Middle, upper and lower band."""
+
+    def __init__(self, period: int = 20, deviations: int = 2):
+        self.period = period
+        self.deviations = deviations
+        self.warmup = period
+        self.window = deque()
+        self.total = 0.0
+        self.total_squared = 0.0
+
+    def bands(self, total: float, total_squared: float):
+        mean = total / self.period
+        deviation = max(total_squared / self.period - mean * mean, 0) ** 0.5
+        return [mean, mean + self.deviations * deviation, mean - self.deviations * deviation]
+
+    def preview(self, close: float):
+        if len(self.window) + 1 < self.period:return None
+        dropped = self.window[0] if len(self.window) == self.period else 0
+        return self.bands(self.total + close - dropped, self.total_squared + close * close - dropped * dropped)
+
+    def update(self, close: float):
+        value = self.preview(close)
+        self.window.append(close)
+        self.total += close
+        self.total_squared += close * close
+        if len(self.window) > self.period:
+            dropped = self.window.popleft()
+            self.total -= dropped
+            self.total_squared -= dropped * dropped
+        return value
+
+INDICATORS = {
+    'sma': (SMA, (20,)),
+    'ema': (EMA, (20,)),
+    'rsi': (RSI, (14,)),
+    'macd': (MACD, (12, 26, 9)),
+    'bb': (Bollinger, (20, 2)),
+}
+
+def parse_spec(spec: str) -> str:
+    """Validate an indicator spec like 'rsi:14' or 'macd:12:26:9' and return it with defaults filled in."""
+    name, *params = spec.strip().lower().split(':')
+    if name not in INDICATORS:raise ValueError(f'Unknown indicator {name}')
+
+    defaults = INDICATORS[name][1]
+    if len(params) > len(defaults):raise ValueError(f'Too many parameters for {name}')
+    params = [int(param) for param in params] + list(defaults[len(params):])
+    if any(param < 1 or param > MAX_PERIOD for param in params):raise ValueError(f'Parameters for {name} must be between 1 and {MAX_PERIOD}')
+
+    return ':'.join([name] + [str(param) for param in params])
+
+def make_indicator(spec: str):
+    name, *params = spec.split(':')
+    return INDICATORS[name][0](*[int(param) for param in params])
+
+class IndicatorSeries:
+    """One indicator with one parameter set on one series and timeframe: committed values plus the open bar."""
+
+    def __init__(self, spec: str, timeframe: int):
+        self.spec = spec
+        self.timeframe = timeframe
+        self.indicator = make_indicator(spec)
+        self.timestamps = [] # committed bar timestamps in seconds
+        self.values = []
+        self.cached_from = None
+        self.open_timestamp = None
+        self.open_close = None
+        self.open_value = None
+        self.version = 0
+        self.last_used = time.time()
+
+    def on_bar(self, timestamp: int, close: float):
+        """Feed the close of the bar at timestamp, committing the previous bar when a new one opens."""
+        if self.open_timestamp is not None:
+            if timestamp < self.open_timestamp:return
+            if timestamp == self.open_timestamp and close == self.open_close:return
+            if timestamp > self.open_timestamp:
+                self.timestamps.append(self.open_timestamp)
+                self.values.append(self.indicator.update(self.open_close))
+                if len(self.timestamps) > MAX_CACHED_BARS:
+                    del self.timestamps[:len(self.timestamps) - MAX_CACHED_BARS]
+                    del self.values[:len(self.values) - MAX_CACHED_BARS]
+                    self.cached_from = self.timestamps[0]
+
+        self.open_timestamp = timestamp
+        self.open_close = close
+        self.open_value = self.indicator.preview(close)
+        self.version += 1
+
+    def value_at(self, timestamp: int):
+        if timestamp == self.open_timestamp:return self.open_value
+        index = bisect.bisect_left(self.timestamps, timestamp)
+        if index < len(self.timestamps) and self.timestamps[index] == timestamp:return self.values[index]
+        return None
+
+    def latest(self) -> dict:
+        committed = [self.timestamps[-1], self.values[-1]] if self.timestamps else None
+        return {'timestamp': self.open_timestamp, 'value': self.open_value, 'committed': committed}
+
+class IndicatorEngine:
+    """Keeps indicator series warm from the historical bars and rolls them forward from the live bar."""
+
+    def __init__(self, historical, tick_database: str = 'prices.db'):
+        self.historical = historical # HistoricalStore
+        self.tick_database = tick_database
+        self.series = {} # (asset_id, pair, timeframe, spec) -> IndicatorSeries, in least recently used order
+
+    def put(self, asset_id: int, pair: str, timeframe: int, spec: str, series: IndicatorSeries):
+        """Cache a series built by build() (in an executor), replacing any older one for the same key."""
+        key = (asset_id, pair, timeframe, spec)
+        self.series.pop(key, None)
+        series.last_used = time.time()
+        self.series[key] = series
+        self.trim()
+
+    def is_cached(self, asset_id: int, pair: str, timeframe: int, spec: str) -> bool:
+        return (asset_id, pair, timeframe, spec) in self.series
+
+    def cached(self, asset_id: int, pair: str, timeframe: int, spec: str, since: int) -> IndicatorSeries | None:
+        """The cached series if it already covers `since` (seconds), never builds or caches anything."""
+        series = self.series.get((asset_id, pair, timeframe, spec))
+        if series is None or series.cached_from is None or series.cached_from > since:return None
+        series.last_used = time.time()
+        return series
+
+    def trim(self):
+        """Drop the least recently used series until both the series count and the total bar count fit."""
+        total = sum(len(series.timestamps) for series in self.series.values())
+        while self.series and (len(self.series) > MAX_SERIES or total > MAX_TOTAL_BARS):
+            total -= len(self.series.pop(next(iter(self.series))).timestamps)
+
+    def build(self, asset_id: int, pair: str, timeframe: int, spec: str, since: int, until: int = None) -> IndicatorSeries:
+        """Compute a series from the stored bars starting a warmup before `since` (seconds).
+
+        Reads SQLite and can take a while for long ranges, callers on the event loop run it in an executor.
+        """
+        series = IndicatorSeries(spec, timeframe)
+        bar_seconds = timeframe * 60
+        start = (since - series.indicator.warmup * bar_seconds) * 1000
+        end = (until if until is not None else int(time.time()) + bar_seconds) * 1000
+        flat_pair = pair.replace('-', '_')
+
+        # Closes per minute from the stored bars, then from ticks that were not rolled up yet.
+        closes = {}
+        for timestamp, close in self.historical.select(f'historical_prices_{asset_id}_{flat_pair}', 'timestamp, close', start, end, inclusive=True):
+            closes[timestamp // 1000] = close
+
+        conn = sqlite3.connect(self.tick_database)
+        try:
+            for timestamp, price in conn.execute(f'SELECT timestamp, price FROM prices_{asset_id}_{flat_pair} WHERE timestamp >= ? AND timestamp < ? ORDER BY timestamp ASC', (start, end)):
+                closes[(timestamp // 1000) // 60 * 60] = price
+        except sqlite3.OperationalError:
+            pass
+        finally:
+            conn.close()
+
+        for timestamp in sorted(closes):
+            series.on_bar(timestamp // bar_seconds * bar_seconds, closes[timestamp])
+
+        series.cached_from = since
+        return series
+
+    def tracked(self) -> set:
+        return {(asset_id, pair) for asset_id, pair, _, _ in self.series}
+
+    def on_live_bars(self, bars: dict):
+        """Roll every series forward with the current 1m bar, bars maps (asset_id, pair) -> (bar timestamp, close)."""
+        for (asset_id, pair, timeframe, _), series in self.series.items():
+            if (asset_id, pair) not in bars:continue
+            bar_timestamp, close = bars[(asset_id, pair)]
+            bar_seconds = timeframe * 60
+            series.on_bar(bar_timestamp // bar_seconds * bar_seconds, close)
+
+    def evict_idle(self):
+        now = time.time()
+        for key in [key for key, series in self.series.items() if now - series.last_used > IDLE_SECONDS]:
+            del self.series[key]
+        self.trim() # live bars keep growing the cached series
@@ -0,0 +1,261 @@
+"""
+End-to-end load test for the price server.
+
+Runs main.py in a subprocess against a fake Solana RPC (websocket + HTTP), connects a swarm of
+synthetic /ws clients and replays /historical_prices traffic, then reports ingest throughput,
+tick-to-client latency, HTTP latency and the server's CPU and memory.
+
+    cd backend
+    python -m loadtest --duration 30 --rate 200 --clients 50
+
+Exits with status 1 if any of the --max-*/--min-* thresholds are broken so it can gate CI.
+"""
+import os, sys, time, json, random, socket, asyncio, argparse, tempfile, subprocess
+
+import httpx
+import uvicorn
+import websockets
+
+from loadtest.layouts import load_programs
+from loadtest.fake_rpc import FakeSolana
+from loadtest.clients import ClientStats, ws_client, historical_traffic, percentiles
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+class ProcessSampler:
+    """Samples CPU and RSS of the server process and its children (ingestion, workers) from /proc (Linux only, reports None elsewhere)."""
+
+    def __init__(self, pid: int):
+        self.pid = pid
+        self.ticks = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+        self.cpu_samples = []
+        self.rss_samples = []
+        self.recording = False
+
+    def pids(self) -> list[int]:
+        pids, queue = [], [self.pid]
+        while queue:
+            pid = queue.pop()
+            pids.append(pid)
+            try:
+                for task in os.listdir(f'/proc/{pid}/task'):
+                    queue.extend(int(child) for child in open(f'/proc/{pid}/task/{task}/children').read().split())
+            except OSError:
+                pass
+        return pids
+
+    def cpu_seconds(self) -> float | None:
+        try:
+            total = 0
+            for pid in self.pids():
+                fields = open(f'/proc/{pid}/stat').read().rsplit(')', 1)[1].split()
+                total += int(fields[11]) + int(fields[12])
+            return total / self.ticks
+        except Exception:
+            return None
+
+    def rss_mb(self) -> float | None:
+        try:
+            total = 0
+            for pid in self.pids():
+                for line in open(f'/proc/{pid}/status'):
+                    if line.startswith('VmRSS:'):total += int(line.split()[1])
+            return total / 1024
+        except Exception:
+            return None
+
+    async def run(self, interval: float = 1):
+        last_cpu, last_time = self.cpu_seconds(), time.perf_counter()
+        while True:
+            await asyncio.sleep(interval)
+            cpu, now = self.cpu_seconds(), time.perf_counter()
+            if self.recording and cpu is not None and last_cpu is not None:
+                self.cpu_samples.append((cpu - last_cpu) / (now - last_time) * 100)
+                self.rss_samples.append(self.rss_mb())
+            last_cpu, last_time = cpu, now
+
+def prepare_workdir(workdir: str, programs: list[dict], rpc_http: str, rpc_ws: str, port: int, workers: int) -> str:
+    """main.py resolves everything relative to its cwd, so give it a throwaway backend/ and frontend/build/."""
+    backend = os.path.join(workdir, 'backend')
+    os.makedirs(backend)
+    os.makedirs(os.path.join(workdir, 'frontend', 'build', 'static'))
+    open(os.path.join(workdir, 'frontend', 'build', 'index.html'), 'w').write('<html></html>')
+
+    server_programs = [{key: value for key, value in program.items() if key not in ('baseVault', 'quoteVault')} for program in programs]
+    open(os.path.join(backend, 'programs.json'), 'w').write(json.dumps(server_programs, indent=4))
+    open(os.path.join(backend, '.env'), 'w').write(f'SOLANA_RPC_URL={rpc_http}\nSOLANA_RPC_WS={rpc_ws}\nHOST=127.0.0.1\nPORT={port}\nWORKERS={workers}\n')
+    return backend
+
+async def wait_for_server(base_url: str, process: subprocess.Popen, timeout: float = 30):
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if process.poll() is not None:raise RuntimeError('server exited during startup')
+            try:
+                if (await client.get('/assets')).status_code == 200:return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError('server did not start in time')
+
+async def fetch_metrics(base_url: str) -> dict | None:
+    try:
+        async with httpx.AsyncClient(base_url=base_url) as client:return (await client.get('/metrics')).json()
+    except Exception:
+        return None
+
+async def run(args) -> dict:
+    programs = load_programs(args.programs, args.copies)
+    rng = random.Random(args.seed)
+    fake = FakeSolana(programs, args.rate, args.seed)
+
+    rpc_ws_port, rpc_http_port, server_port = free_port(), free_port(), free_port()
+    rpc_server = uvicorn.Server(uvicorn.Config(fake.http_app(), host='127.0.0.1', port=rpc_http_port, log_level='warning'))
+    rpc_http_task = asyncio.create_task(rpc_server.serve())
+
+    workdir = tempfile.mkdtemp(prefix='prices-loadtest-')
+    backend = prepare_workdir(workdir, programs, f'http://127.0.0.1:{rpc_http_port}', f'ws://127.0.0.1:{rpc_ws_port}', server_port, args.workers)
+    log = open(os.path.join(workdir, 'server.log'), 'w')
+
+    tasks = []
+    async with websockets.serve(fake.ws_handler, '127.0.0.1', rpc_ws_port, max_size=None):
+        process = subprocess.Popen([sys.executable, os.path.join(BACKEND_DIR, 'main.py')], cwd=backend, stdout=log, stderr=subprocess.STDOUT)
+        try:
+            base_url = f'http://127.0.0.1:{server_port}'
+            await wait_for_server(base_url, process)
+
+            sampler = ProcessSampler(process.pid)
+            client_stats = ClientStats()
+            http_stats = {'latencies': [], 'errors': 0, 'recording': False}
+
+            series = [(program['asset_id'], pair) for program in programs for pair in program['pairs']]
+            bar_keys = [f'{asset_id}_{pair.replace("-", "_")}' for asset_id, pair in series]
+            indicators = [spec for spec in args.indicators.split(',') if spec]
+            forward_pairs = {program['asset_id']: f'{program["symbolA"]}-{program["symbolB"]}' for program in programs}
+
+            tasks.append(asyncio.create_task(sampler.run()))
+            tasks.append(asyncio.create_task(fake.emit_loop()))
+            for _ in range(args.clients):
+                tasks.append(asyncio.create_task(ws_client(f'ws://127.0.0.1:{server_port}/ws', bar_keys, args.bar_subscriptions, indicators, fake.pending, forward_pairs, client_stats, rng)))
+                await asyncio.sleep(args.connect_interval)
+            if args.http_rps > 0:
+                tasks.append(asyncio.create_task(historical_traffic(base_url, series, args.http_rps, indicators, http_stats, rng)))
+
+            await asyncio.sleep(args.warmup)
+            client_stats.recording = http_stats['recording'] = sampler.recording = True
+            # The fake RPC's send rate only shows what the socket buffers absorbed, throughput is what the server handled.
+            start_metrics = await fetch_metrics(base_url)
+            sent_start, rpc_start, started = fake.frames_sent, fake.rpc_requests, time.perf_counter()
+
+            await asyncio.sleep(args.duration)
+
+            elapsed = time.perf_counter() - started
+            sent = fake.frames_sent - sent_start
+            crashed = process.poll() is not None
+            server_metrics = await fetch_metrics(base_url)
+            frames = None
+            if start_metrics is not None and server_metrics is not None:
+                frames = server_metrics['frames_handled'] - start_metrics['frames_handled']
+        finally:
+            for task in tasks:task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            process.terminate()
+            try:process.wait(timeout=10)
+            except subprocess.TimeoutExpired:process.kill()
+            rpc_server.should_exit = True
+            await rpc_http_task
+            log.close()
+
+    cpu = sampler.cpu_samples
+    rss = [value for value in sampler.rss_samples if value is not None]
+    return {
+        'config': {key: value for key, value in vars(args).items() if key != 'json'} | {'series': len(series)},
+        'server_log': os.path.join(workdir, 'server.log'),
+        'server_crashed': crashed,
+        'ingest': {
+            'target_frames_per_sec': args.rate,
+            'frames_per_sec': frames / elapsed if frames is not None else None,
+            'frames': frames,
+            'sent_frames_per_sec': sent / elapsed,
+            'sent_frames': sent,
+            'rpc_requests_per_sec': (fake.rpc_requests - rpc_start) / elapsed,
+        },
+        'clients': {
+            'connected': client_stats.connected,
+            'failed': client_stats.failed,
+            'disconnected': client_stats.disconnected,
+            'messages_per_sec': client_stats.messages / (elapsed + args.warmup),
+            'bytes_per_sec': client_stats.bytes / (elapsed + args.warmup),
+            'price_messages': client_stats.price_messages,
+            'bar_messages': client_stats.bar_messages,
+            'indicator_messages': client_stats.indicator_messages,
+        },
+        'tick_to_client_ms': {key: (value * 1000 if isinstance(value, float) else value) for key, value in percentiles(client_stats.latencies).items()},
+        'historical_prices_ms': {key: (value * 1000 if isinstance(value, float) else value) for key, value in percentiles(http_stats['latencies']).items()} | {'errors': http_stats['errors']},
+        'server_cpu_percent': {'mean': sum(cpu) / len(cpu) if cpu else None, 'max': max(cpu) if cpu else None},
+        'server_metrics': server_metrics, # one worker's /metrics when --workers > 1
+        'server_rss_mb': {'mean': sum(rss) / len(rss) if rss else None, 'max': max(rss) if rss else None},
+    }
+
+def check_thresholds(report: dict, args) -> list[str]:
+    failures = []
+    if report['server_crashed']:failures.append('server process exited during the run')
+    if report['clients']['failed'] > 0:failures.append(f'{report["clients"]["failed"]} websocket clients failed')
+
+    p99 = report['tick_to_client_ms']['p99']
+    if args.max_p99_ms is not None and (p99 is None or p99 > args.max_p99_ms):
+        failures.append(f'tick-to-client p99 {p99} ms > {args.max_p99_ms} ms')
+
+    frames_per_sec = report['ingest']['frames_per_sec']
+    if args.min_ingest_ratio is not None:
+        if frames_per_sec is None:
+            failures.append('could not read frames_handled from /metrics')
+        elif frames_per_sec / args.rate < args.min_ingest_ratio:
+            failures.append(f'ingest reached {frames_per_sec / args.rate:.2%} of the target rate < {args.min_ingest_ratio:.2%}')
+
+    http_p99 = report['historical_prices_ms']['p99']
+    if args.max_http_p99_ms is not None and http_p99 is not None and http_p99 > args.max_http_p99_ms:
+        failures.append(f'/historical_prices p99 {http_p99} ms > {args.max_http_p99_ms} ms')
+
+    rss = report['server_rss_mb']['max']
+    if args.max_rss_mb is not None and rss is not None and rss > args.max_rss_mb:
+        failures.append(f'server RSS {rss:.1f} MB > {args.max_rss_mb} MB')
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m loadtest', description='End-to-end load test for the price server.')
+    parser.add_argument('--programs', default=os.path.join(BACKEND_DIR, 'programs.json'), help='programs.json to derive synthetic pools from')
+    parser.add_argument('--copies', type=int, default=1, help='clone every program this many times to add series')
+    parser.add_argument('--workers', type=int, default=1, help='uvicorn workers (WORKERS in .env), >1 runs a separate ingestion process')
+    parser.add_argument('--rate', type=float, default=100, help='accountNotification frames per second')
+    parser.add_argument('--clients', type=int, default=25, help='synthetic /ws clients')
+    parser.add_argument('--bar-subscriptions', type=int, default=2, help='subscribe_bars per client')
+    parser.add_argument('--indicators', default='', help='comma separated indicators for clients and /historical_prices, e.g. rsi:14,macd')
+    parser.add_argument('--connect-interval', type=float, default=0.01, help='seconds between client connects')
+    parser.add_argument('--http-rps', type=float, default=5, help='/historical_prices requests per second, 0 to disable')
+    parser.add_argument('--warmup', type=float, default=5, help='seconds before measuring')
+    parser.add_argument('--duration', type=float, default=20, help='seconds to measure')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help='also write the report to this file')
+    parser.add_argument('--max-p99-ms', type=float, help='fail if tick-to-client p99 exceeds this')
+    parser.add_argument('--max-http-p99-ms', type=float, help='fail if /historical_prices p99 exceeds this')
+    parser.add_argument('--min-ingest-ratio', type=float, help='fail if frames/sec handled by the server falls below this fraction of --rate')
+    parser.add_argument('--max-rss-mb', type=float, help='fail if server RSS exceeds this')
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    failures = check_thresholds(report, args)
+    report['failures'] = failures
+
+    print(json.dumps(report, indent=4))
+    if args.json:open(args.json, 'w').write(json.dumps(report, indent=4))
+    for failure in failures:print('FAIL:', failure, file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+if __name__ == '__main__':
+    main()
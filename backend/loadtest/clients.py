@@ -0,0 +1,88 @@
+import time, json, random, asyncio
+
+import httpx
+import websockets
+
+def percentiles(samples: list[float], points: tuple = (50, 90, 99, 99.9)) -> dict:
+    if not samples:return {f'p{p}': None for p in points} | {'max': None, 'count': 0}
+    ordered = sorted(samples)
+    result = {f'p{p}': ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))] for p in points}
+    result['max'] = ordered[-1]
+    result['count'] = len(ordered)
+    return result
+
+class ClientStats:
+    def __init__(self):
+        self.connected = 0
+        self.failed = 0
+        self.disconnected = 0
+        self.messages = 0
+        self.bytes = 0
+        self.price_messages = 0
+        self.bar_messages = 0
+        self.indicator_messages = 0
+        self.latencies = [] # seconds, tick sent by the fake RPC -> price received by a client
+        self.recording = False
+
+async def ws_client(url: str, series: list[str], bar_subscriptions: int, indicators: list[str], pending: dict, forward_pairs: dict, stats: ClientStats, rng: random.Random):
+    """One synthetic browser: subscribes to bars like Asset.js and times every forward pair price it receives."""
+    try:
+        async with websockets.connect(url, max_size=None) as ws:
+            stats.connected += 1
+            for key in rng.sample(series, min(bar_subscriptions, len(series))):
+                await ws.send(json.dumps({'type': 'subscribe_bars', 'asset_id': key}))
+                if indicators:await ws.send(json.dumps({'type': 'subscribe_indicators', 'asset_id': key, 'timeframe': 1, 'indicators': indicators}))
+
+            async for raw in ws:
+                received = time.perf_counter()
+                stats.messages += 1
+                stats.bytes += len(raw)
+                message = json.loads(raw)
+
+                if message['type'] == 'bars':
+                    stats.bar_messages += 1
+                    continue
+                if message['type'] == 'indicators':
+                    stats.indicator_messages += 1
+                    continue
+                if message['type'] != 'prices':continue
+                stats.price_messages += 1
+
+                if not stats.recording:continue
+                for asset_id, pairs in message['data'].items():
+                    pair = forward_pairs.get(int(asset_id))
+                    if pair is None or pair not in pairs:continue
+                    sent = pending.get(int(asset_id), {}).get(pairs[pair])
+                    if sent is not None:stats.latencies.append(received - sent)
+    except asyncio.CancelledError:
+        raise
+    except Exception:
+        stats.failed += 1
+        return
+    stats.disconnected += 1
+
+async def historical_traffic(base_url: str, series: list[tuple[int, str]], rps: float, indicators: list[str], stats: dict, rng: random.Random):
+    """Scripted /historical_prices requests shaped like the chart page: a few hours back at a random timeframe."""
+    async with httpx.AsyncClient(base_url=base_url, timeout=30) as client:
+        async def one():
+            asset_id, pair = rng.choice(series)
+            timeframe = rng.choice([1, 1, 5, 15, 60])
+            now = int(time.time())
+            params = {'from': now - rng.choice([60*60, 60*60*6, 60*60*24]), 'to': now, 'timeframe': timeframe}
+            if indicators:params['indicators'] = ','.join(indicators)
+            start = time.perf_counter()
+            try:
+                response = await client.get(f'/historical_prices/{asset_id}/{pair}', params=params)
+                response.raise_for_status()
+                if not isinstance(response.json(), list):raise ValueError(response.text)
+                if stats['recording']:stats['latencies'].append(time.perf_counter() - start)
+            except Exception:
+                stats['errors'] += 1
+
+        tasks = set()
+        interval = 1 / rps
+        while True:
+            task = asyncio.create_task(one())
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            await asyncio.sleep(interval)
@@ -0,0 +1,118 @@
+import time, json, random, asyncio, importlib
+
+import websockets
+from fastapi import FastAPI, Request
+
+from loadtest.layouts import AccountEncoder, account_notification
+
+class FakeSolana:
+    """Stand-in for the Solana RPC: a websocket that streams accountNotification frames and an HTTP getTokenAccountBalance."""
+
+    def __init__(self, programs: list[dict], rate: float, seed: int = 0):
+        self.programs = {program['programId']: program for program in programs}
+        self.rate = rate
+        self.random = random.Random(seed)
+
+        self.balances = {}
+        self.encoders = {key: AccountEncoder(program, self.balances) for key, program in self.programs.items()}
+        self.handlers = {}
+        self.target_prices = {key: self.random.uniform(1, 100) for key in self.programs}
+
+        self.connections = set()
+        self.subscriptions = {} # programId -> subscription id, shared across connections
+        self.pending = {} # asset_id -> {expected price: perf_counter at send}
+        self.frames_sent = 0
+        self.rpc_requests = 0
+        self.slot = 0
+
+    async def expected_price(self, program_id: str, data: bytes, exact: float | None) -> float | None:
+        if exact is not None:return exact
+        program = self.programs[program_id]
+        if program_id not in self.handlers:
+            module_name, function_name = program['handler'].rsplit('.', 1)
+            self.handlers[program_id] = getattr(importlib.import_module(module_name), function_name)
+        return await self.handlers[program_id](data, program)
+
+    async def ws_handler(self, websocket):
+        self.connections.add(websocket)
+        try:
+            async for raw in websocket:
+                message = json.loads(raw)
+                if message.get('method') != 'accountSubscribe':continue
+
+                program_id = message['params'][0]
+                if program_id not in self.subscriptions:
+                    self.subscriptions[program_id] = len(self.subscriptions) + 1
+                await websocket.send(json.dumps({'jsonrpc': '2.0', 'result': self.subscriptions[program_id], 'id': message['id']}))
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            self.connections.discard(websocket)
+
+    async def emit_frame(self, program_id: str):
+        program = self.programs[program_id]
+
+        # Random walk the target so nearly every frame changes the price.
+        self.target_prices[program_id] *= 1 + self.random.uniform(-0.002, 0.002)
+        data, exact = self.encoders[program_id].encode(self.target_prices[program_id])
+        price = await self.expected_price(program_id, data, exact)
+
+        self.slot += 1
+        frame = account_notification(self.subscriptions[program_id], self.slot, data)
+
+        pending = self.pending.setdefault(program['asset_id'], {})
+        if price is not None:
+            pending.pop(price, None)
+            pending[price] = time.perf_counter()
+            if len(pending) > 1000:del pending[next(iter(pending))]
+
+        for websocket in list(self.connections):
+            try:await websocket.send(frame)
+            except websockets.ConnectionClosed:pass
+        self.frames_sent += 1
+
+    async def emit_loop(self):
+        """Emit frames at `rate` per second across all subscribed programs, catching up in bursts if the loop falls behind."""
+        interval = 1 / self.rate
+        next_send = time.perf_counter()
+        while True:
+            subscribed = [key for key in self.programs if key in self.subscriptions]
+            if not subscribed or not self.connections:
+                await asyncio.sleep(0.05)
+                next_send = time.perf_counter()
+                continue
+
+            now = time.perf_counter()
+            due = min(int((now - next_send) / interval) + 1, 1000)
+            for _ in range(due):
+                await self.emit_frame(self.random.choice(subscribed))
+            next_send += due * interval
+            await asyncio.sleep(max(0, next_send - time.perf_counter()))
+
+    def http_app(self) -> FastAPI:
+        app = FastAPI(docs_url=None, redoc_url=None)
+
+        @app.post('/')
+        async def rpc(request: Request):
+            requests = await request.json()
+            single = not isinstance(requests, list)
+            if single:requests = [requests]
+
+            responses = []
+            for item in requests:
+                self.rpc_requests += 1
+                if item.get('method') != 'getTokenAccountBalance':
+                    responses.append({'jsonrpc': '2.0', 'id': item.get('id'), 'error': {'code': -32601, 'message': 'Method not found'}})
+                    continue
+                balance, decimals = self.balances.get(item['params'][0], (0, 0))
+                responses.append({
+                    'jsonrpc': '2.0',
+                    'id': item['id'],
+                    'result': {
+                        'context': {'slot': self.slot},
+                        'value': {'amount': str(balance * 10 ** decimals), 'decimals': decimals, 'uiAmount': float(balance), 'uiAmountString': str(balance)},
+                    },
+                })
+            return responses[0] if single else responses
+
+        return app
@@ -0,0 +1,102 @@
+import os, math, copy, json, base64
+
+import base58
+
+# Account sizes of the real pools, the parsers only look at the first few hundred bytes.
+ACCOUNT_SIZES = {
+    'parsers.raydium.price_from_clmm': 1544,
+    'parsers.raydium.price_from_amm': 752,
+    'parsers.orca.price_from_whirlpool': 653,
+    'parsers.meteora.price_from_dlmm': 904,
+    'parsers.lifinity.price_from_pool': 895,
+}
+
+DLMM_BIN_STEP = 10
+AMM_BASE_BALANCE = 1_000_000
+
+def random_pubkey() -> str:
+    return base58.b58encode(os.urandom(32)).decode('utf-8')
+
+def load_programs(path: str, copies: int = 1) -> list[dict]:
+    """Load programs.json, keeping only handlers we can encode, and clone it `copies` times with fresh asset ids."""
+    base = [p for p in json.loads(open(path, 'r').read()) if p['handler'] in ACCOUNT_SIZES]
+
+    programs = []
+    next_asset_id = max(p['asset_id'] for p in base) + 1
+    for copy_index in range(copies):
+        for program in base:
+            program = copy.deepcopy(program)
+            if copy_index > 0:
+                program['asset_id'] = next_asset_id
+                next_asset_id += 1
+            program['programId'] = random_pubkey()
+            if program['handler'] == 'parsers.raydium.price_from_amm':
+                program['baseVault'] = random_pubkey()
+                program['quoteVault'] = random_pubkey()
+            programs.append(program)
+    return programs
+
+class AccountEncoder:
+    """Builds account data for a program so that its handler decodes to (roughly) a target price."""
+
+    def __init__(self, program: dict, balances: dict):
+        self.program = program
+        self.balances = balances # shared with the fake HTTP RPC for AMM vaults
+        self.size = ACCOUNT_SIZES[program['handler']]
+
+    def encode(self, price: float) -> tuple[bytes, float | None]:
+        """Return the account bytes and the exact price the handler will compute, if it can be known without the handler."""
+        program = self.program
+        data = bytearray(self.size)
+        handler = program['handler']
+        adjustment = 10 ** (program['decimalsA'] - program['decimalsB'])
+
+        if handler == 'parsers.raydium.price_from_clmm':
+            sqrt_price = int(math.sqrt(price / adjustment) * 2**64)
+            data[233] = program['decimalsA']
+            data[234] = program['decimalsB']
+            data[253:269] = sqrt_price.to_bytes(16, 'little')
+
+        elif handler == 'parsers.orca.price_from_whirlpool':
+            sqrt_price = int(math.sqrt(price / adjustment) * 2**64)
+            data[65:81] = sqrt_price.to_bytes(16, 'little')
+
+        elif handler == 'parsers.meteora.price_from_dlmm':
+            active_id = round(math.log(price / adjustment) / math.log(1.0001) / DLMM_BIN_STEP)
+            data[76:80] = active_id.to_bytes(4, 'little', signed=True)
+            data[80:82] = DLMM_BIN_STEP.to_bytes(2, 'little')
+
+        elif handler == 'parsers.lifinity.price_from_pool':
+            last_price = max(1, int(price * 10 ** program['decimalsA']))
+            data[519:527] = last_price.to_bytes(8, 'little')
+
+        elif handler == 'parsers.raydium.price_from_amm':
+            quote = max(1, round(price * AMM_BASE_BALANCE))
+            self.balances[program['baseVault']] = (AMM_BASE_BALANCE, program['decimalsA'])
+            self.balances[program['quoteVault']] = (quote, program['decimalsB'])
+            data[336:368] = base58.b58decode(program['baseVault'])
+            data[368:400] = base58.b58decode(program['quoteVault'])
+            return bytes(data), quote / AMM_BASE_BALANCE
+
+        return bytes(data), None
+
+def account_notification(subscription: int, slot: int, data: bytes) -> str:
+    """Format an accountNotification frame the way the Solana RPC sends it."""
+    return json.dumps({
+        'jsonrpc': '2.0',
+        'method': 'accountNotification',
+        'params': {
+            'result': {
+                'context': {'slot': slot},
+                'value': {
+                    'data': [base64.b64encode(data).decode('utf-8'), 'base64'],
+                    'executable': False,
+                    'lamports': 1_000_000_000,
+                    'owner': '11111111111111111111111111111111',
+                    'rentEpoch': 18446744073709551615,
+                    'space': len(data),
+                },
+            },
+            'subscription': subscription,
+        },
+    })
@@ -1,25 +1,45 @@
-import os, time, traceback, json, math
+import os, time, traceback, json, math, threading
 import base58, base64, httpx, sqlite3
 import sqlite3, websockets, asyncio, uvicorn
 
-from fastapi.responses import FileResponse
 from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse
 
 from dotenv import dotenv_values
 from collections import defaultdict
 
+from price_board import PriceBoard, MAX_NAME_BYTES
+from historical_store import HistoricalStore, missing_column
+from indicators import IndicatorEngine, parse_spec, CACHE_WINDOW, WARM_WINDOW
+from static_assets import StaticAssets, StaticAssetMiddleware
+from catalog import Catalog, entry_response
+from send_queue import ConflatingSendQueue, SlowClient, metrics as send_metrics
+
 ENV = dotenv_values('.env')
+WORKERS = int(ENV.get('WORKERS', 1))
+PRICE_BOARD = ENV.get('PRICE_BOARD', 'price_board.bin')
+INGESTION_TIMEOUT = 30 # seconds without a heartbeat before the ingestion counts as stalled
+HISTORICAL_DIR = ENV.get('HISTORICAL_DIR', 'historical')
+STATIC_CACHE = ENV.get('STATIC_CACHE', 'static_cache')
 
 app = FastAPI(docs_url=None,redoc_url=None,)
 app.add_middleware(GZipMiddleware,minimum_size=1000,)
 app.add_middleware(CORSMiddleware,allow_origins=["*"],allow_credentials=True,allow_methods=["*"],allow_headers=["*"],)
+app.state.static_assets = StaticAssets("../frontend/build", STATIC_CACHE) # loaded on startup
+app.add_middleware(StaticAssetMiddleware,assets=app.state.static_assets,spa_routes={'index','serve_app'},) # outermost, so the frontend skips gzip
 app.state.price_store = {}
 app.state.programs = None
 app.state.valid_tables = set()
 app.state.programs_changed = 0
+app.state.series = {}
+app.state.board = None
+app.state.historical = HistoricalStore(HISTORICAL_DIR)
+app.state.indicators = IndicatorEngine(app.state.historical)
+app.state.indicator_builds = {} # (asset_id, pair, timeframe, spec) -> task building it in the executor
+app.state.catalog = Catalog()
 
 active_connections = []
 client = httpx.AsyncClient()
@@ -39,10 +59,15 @@ def load_functions(programs: dict):
                 module_name, function_name = program['handler'].rsplit('.', 1)
                 module = __import__(module_name, fromlist=[function_name])
                 program['handler'] = getattr(module, function_name)
-                for pair in program['pairs']:
+                for pair in list(program['pairs']):
+                    if len(f'{program["asset_id"]}/{pair}'.encode('utf-8')) > MAX_NAME_BYTES:
+                        print(f"Skipping pair {pair} of program {program['asset_id']}: the price board allows {MAX_NAME_BYTES} bytes for 'asset_id/pair'")
+                        program['pairs'].remove(pair)
+                        continue
                     app.state.valid_tables.add(f'historical_prices_{program["asset_id"]}_{pair.replace("-", "_")}')
                     app.state.valid_tables.add(f'prices_{program["asset_id"]}_{pair.replace("-", "_")}')
                     app.state.valid_tables.add(f'metadata_{program["asset_id"]}_{pair.replace("-", "_")}')
+                    app.state.series[f'{program["asset_id"]}_{pair.replace("-", "_")}'] = (program['asset_id'], pair)
             except Exception as e:
                 print(f"Error loading program {program['handler']}: {e}")
     except:pass
@@ -55,7 +80,7 @@ app.mount("/static", StaticFiles(directory="../frontend/build/static"), name="st
 # Initialize the price tables and loop for price updates.
 async def update_prices():
     conn = sqlite3.connect(f'prices.db')
-    conn_historical = sqlite3.connect(f'prices_historical.db')
+    historical_tables = []
 
     for program in app.state.programs:
 
@@ -66,19 +91,15 @@ async def update_prices():
             cursor.execute(f'CREATE TABLE IF NOT EXISTS prices_{asset_id}_{flat_pair} (pair TEXT, price REAL, timestamp INTEGER, source CHAR(16))')
             cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_timestamp_{asset_id}_{flat_pair} ON prices_{asset_id}_{flat_pair}(timestamp)')
 
-            cursor_historical = conn_historical.cursor()
-            cursor_historical.execute(f'CREATE TABLE IF NOT EXISTS historical_prices_{asset_id}_{flat_pair} (pair TEXT, high REAL, low REAL, open REAL, close REAL, timestamp INTEGER)')
-            cursor_historical.execute(f'CREATE INDEX IF NOT EXISTS idx_timestamp_{asset_id}_{flat_pair} ON  historical_prices_{asset_id}_{flat_pair}(timestamp)')
+            historical_tables.append(f'historical_prices_{asset_id}_{flat_pair}')
             
     conn.commit()
-    conn_historical.commit()
+    app.state.historical.create_tables(historical_tables) # in the current month's partition
 
     del asset_id
     del pair
 
-    conn_historical.cursor()
-    conn_historical.close()
-
+    frames_handled = app.state.board.frames_handled() # carries on after an ingestion restart
     while True:
         try:
             async with websockets.connect(ENV['SOLANA_RPC_WS']) as ws:
@@ -129,7 +150,10 @@ async def update_prices():
                     account_data = base64.b64decode(message['params']['result']['value']['data'][0])
 
                     price = await program['handler'](account_data, program)
-                    if price is None:continue
+                    if price is None:
+                        frames_handled += 1
+                        app.state.board.set_frames_handled(frames_handled)
+                        continue
 
                     program['price'] = price
 
@@ -169,11 +193,17 @@ async def update_prices():
                     if len(updated_pairs) > 0:
                         for pair in updated_pairs:
                             flat_pair = pair.replace('-', '_')
-                            cursor.execute(f'INSERT INTO prices_{program["asset_id"]}_{flat_pair} (pair, price, timestamp, source) VALUES (?, ?, ?, ?)', (pair, pair_values[pair], int(time.time()*1000), 'solana'))
+                            timestamp = int(time.time()*1000)
+                            cursor.execute(f'INSERT INTO prices_{program["asset_id"]}_{flat_pair} (pair, price, timestamp, source) VALUES (?, ?, ?, ?)', (pair, pair_values[pair], timestamp, 'solana'))
                             if program['asset_id'] not in app.state.price_store:
                                 app.state.price_store[program['asset_id']] = {}
                             app.state.price_store[program['asset_id']][pair] = pair_values[pair] 
+                            app.state.board.write(program['asset_id'], pair, pair_values[pair], timestamp)
                         conn.commit()
+
+                    # Counted once the frame is fully processed so /metrics shows the real ingest rate.
+                    frames_handled += 1
+                    app.state.board.set_frames_handled(frames_handled)
         except asyncio.CancelledError:
             break
         except:
@@ -186,14 +216,18 @@ async def historical_prices_manager():
     last_historical_combination = None
     historical_bar_minimum = 60 # 1 minute for historical bars
     last_historical_combination = time.time() // historical_bar_minimum
+    last_window_minute = None
 
     conn = sqlite3.connect(f'prices.db')
-    conn_historical = sqlite3.connect(f'prices_historical.db')
-    cursor_historical = conn_historical.cursor()
     while True:
         try:
             await asyncio.sleep(1)
             load_functions(app.state.programs)
+
+            # The 24h stats only move on ticks, expire them for series that went quiet.
+            if time.time() // 60 != last_window_minute:
+                last_window_minute = time.time() // 60
+                app.state.board.advance_windows(int(time.time() * 1000))
             if last_historical_combination == None or (time.time() // historical_bar_minimum) - last_historical_combination > 1:
                 last_historical_combination = time.time() // historical_bar_minimum
                 
@@ -228,72 +262,213 @@ async def historical_prices_manager():
                                     'low': item['price'],
                                     'close': item['price'],
                                     'timestamp': bar_timestamp,
+                                    'ticks': 1,
                                 }
                             else:
                                 bars[bar_timestamp]['high'] = max(bars[bar_timestamp]['high'], item['price'])
                                 bars[bar_timestamp]['low'] = min(bars[bar_timestamp]['low'], item['price'])
                                 bars[bar_timestamp]['close'] = item['price']
+                                bars[bar_timestamp]['ticks'] += 1
 
-                        # Convert to list if needed
-                        bars_list = list(bars.values())
-                        for bar in bars_list:
-                            cursor_historical.execute(f'SELECT pair, high, low, open, close, timestamp FROM historical_prices_{asset_id_and_pair} WHERE timestamp = ?', (bar['timestamp'],))
-                            fetch_result = cursor_historical.fetchone()
-                            if fetch_result is not None:
-                                bar['high'] = max(bar['high'], fetch_result[1])
-                                bar['low'] = min(bar['low'], fetch_result[2])
-                                bar['open'] = fetch_result[3]
-                                bar['close'] = fetch_result[4]
-                                cursor_historical.execute(f'UPDATE historical_prices_{asset_id_and_pair} SET high = ?, low = ?, open = ?, close = ? WHERE timestamp = ?', (bar['high'], bar['low'], bar['open'], bar['close'], bar['timestamp']))
-                            else:
-                                cursor_historical.execute(f'INSERT INTO historical_prices_{asset_id_and_pair} (pair, high, low, open, close, timestamp) VALUES (?, ?, ?, ?, ?, ?)', (bar['pair'], bar['high'], bar['low'], bar['open'], bar['close'], bar['timestamp']))
-                        conn_historical.commit()
+                        # Each bar goes to the partition of its month, normally only the current one.
+                        app.state.historical.upsert_bars(f'historical_prices_{asset_id_and_pair}', list(bars.values()))
 
                         cursor.execute(f'DELETE FROM {table[0]} WHERE timestamp < ?', (cut_off,))
                         conn.commit()
+
+                # Months that are over are compacted and become read-only, VACUUM can take a while so not on the event loop.
+                for name, start, end in app.state.historical.start_freezing():
+                    await asyncio.get_running_loop().run_in_executor(None, app.state.historical.freeze, name, start, end)
         except Exception as e:
             traceback.print_exc()
 
 
-@app.on_event("startup")
-async def startup_event():
- 
-    # Get the most recent price for each pair for the price storage.
+# Get the most recent price for each pair for the price storage and publish it on the board.
+def load_price_store():
     try:
         conn = sqlite3.connect(f'prices.db')
         cursor = conn.cursor()
         for program in app.state.programs:
             for pair in program['pairs']:
-                cursor.execute(f'SELECT price FROM prices_{program["asset_id"]}_{pair.replace("-", "_")} ORDER BY timestamp DESC LIMIT 1')
-                value = cursor.fetchone()
+                flat_pair = pair.replace("-", "_")
+
+                # Seed the 24h stats from the stored bars and the ticks that were not rolled up yet.
+                table = f'historical_prices_{program["asset_id"]}_{flat_pair}'
+                since, until = int(time.time() - 60*60*24)*1000, int(time.time() + 60)*1000
+                try:
+                    bars = app.state.historical.select(table, 'timestamp, high, low, ticks', since, until, inclusive=True)
+                except sqlite3.OperationalError as e:
+                    if not missing_column(e):raise # months written before bars counted their ticks
+                    bars = app.state.historical.select(table, 'timestamp, high, low, NULL', since, until, inclusive=True)
+                try:
+                    bars += cursor.execute(f'SELECT timestamp, price, price, 1 FROM prices_{program["asset_id"]}_{flat_pair} WHERE timestamp >= ?', (since,)).fetchall()
+                except sqlite3.OperationalError:
+                    pass
+                app.state.board.seed_window(program['asset_id'], pair, sorted(bars, key=lambda bar: bar[0]))
+
+                try:
+                    cursor.execute(f'SELECT price, timestamp FROM prices_{program["asset_id"]}_{flat_pair} ORDER BY timestamp DESC LIMIT 1')
+                    value = cursor.fetchone()
+                except sqlite3.OperationalError:
+                    value = None
+                if not value: # The ticks were already rolled up, fall back to the last bar.
+                    value = app.state.historical.last(f'historical_prices_{program["asset_id"]}_{flat_pair}', 'close, timestamp')
                 if value:
                     if program['asset_id'] not in app.state.price_store:app.state.price_store[program['asset_id']] = {}
                     app.state.price_store[program['asset_id']][pair] = value[0]
+                    app.state.board.write(program['asset_id'], pair, value[0], value[1], bar=False)
+        conn.close()
     except:
-        pass
+        traceback.print_exc()
+
+# Tell the workers and the supervisor that the ingestion's event loop is alive.
+async def ingestion_heartbeat():
+    while True:
+        app.state.board.beat()
+        await asyncio.sleep(1)
+
+# Workers pick up programs.json changes on their own, the ingestion does it in historical_prices_manager.
+async def watch_programs():
+    while True:
+        await asyncio.sleep(1)
+        try:load_functions(app.state.programs)
+        except:traceback.print_exc()
+
+# Mirror the board into the price store when another process does the ingestion.
+async def sync_price_board():
+    while True:
+        try:
+            for asset_id, pair, price, updated in app.state.board.prices():
+                if asset_id not in app.state.price_store:app.state.price_store[asset_id] = {}
+                app.state.price_store[asset_id][pair] = price
+        except asyncio.CancelledError:
+            raise
+        except:
+            traceback.print_exc()
+        await asyncio.sleep(0.02)
+
+# Build an indicator series in the executor and cache it, one build per series at a time.
+async def build_indicator(series_key: tuple, since: int):
+    try:
+        series = await asyncio.get_running_loop().run_in_executor(None, app.state.indicators.build, *series_key, since)
+        app.state.indicators.put(*series_key, series)
+    except asyncio.CancelledError:
+        raise
+    except:
+        traceback.print_exc()
+    finally:
+        app.state.indicator_builds.pop(series_key, None)
+
+def warm_indicator(series_key: tuple, since: int = None):
+    if series_key in app.state.indicator_builds:return app.state.indicator_builds[series_key]
+    task = asyncio.create_task(build_indicator(series_key, since if since is not None else int(time.time()) - WARM_WINDOW))
+    app.state.indicator_builds[series_key] = task
+    return task
+
+# Roll the cached indicator series forward from the open bars on the board.
+async def indicator_feed():
+    while True:
+        try:
+            bars = {}
+            for asset_id, pair in app.state.indicators.tracked():
+                board_entry = app.state.board.read(asset_id, pair)
+                if board_entry is not None and board_entry['bar_timestamp'] > 0:
+                    bars[(asset_id, pair)] = (board_entry['bar_timestamp'], board_entry['bar'][3])
+            app.state.indicators.on_live_bars(bars)
+            app.state.indicators.evict_idle()
+        except asyncio.CancelledError:
+            raise
+        except:
+            traceback.print_exc()
+        await asyncio.sleep(0.1)
+
+# Standalone ingestion process used when running with multiple workers.
+def run_ingestion():
+    app.state.historical.migrate_legacy('prices_historical.db')
+    app.state.board = PriceBoard(PRICE_BOARD) # created by main(), never reset here since workers already read it
+    load_price_store()
+
+    async def ingest():
+        await asyncio.gather(update_prices(), historical_prices_manager(), ingestion_heartbeat())
+    asyncio.run(ingest())
+
+# Keep one ingestion process running, restarting it when it exits or its heartbeat stops.
+def supervise_ingestion(stopping: threading.Event):
+    import multiprocessing
+    board = PriceBoard(PRICE_BOARD)
+    while not stopping.is_set():
+        started = int(time.time() * 1000)
+        process = multiprocessing.Process(target=run_ingestion, name='ingestion', daemon=True)
+        process.start()
+        while process.is_alive() and not stopping.is_set():
+            process.join(1)
+            # Only once it has beaten, the legacy migration and seeding run before the event loop.
+            heartbeat = board.heartbeat()
+            if heartbeat > started and time.time() - heartbeat / 1000 > INGESTION_TIMEOUT:
+                print(f'Ingestion stalled for more than {INGESTION_TIMEOUT} seconds, killing it.')
+                process.kill()
+                process.join()
+
+        if stopping.is_set():
+            process.terminate()
+            process.join(10)
+            if process.is_alive():process.kill()
+            break
+        print(f'Ingestion exited with code {process.exitcode}, restarting it.')
+        stopping.wait(1)
+    board.close()
+
+@app.on_event("startup")
+async def startup_event():
+    app.state.background_tasks = []
+
+    # Loaded here rather than on import, the supervisor and the multiprocessing re-imports never serve it.
+    await app.state.static_assets.load()
+    app.state.background_tasks.append(asyncio.create_task(app.state.static_assets.watch()))
+
+    # Workers spawned by main() only read the board, the ingestion process owns the RPC subscription.
+    if os.environ.get('PRICES_INGESTION') == 'external':
+        while not os.path.exists(PRICE_BOARD):await asyncio.sleep(0.1)
+        app.state.board = PriceBoard(PRICE_BOARD)
+        app.state.background_tasks.append(asyncio.create_task(watch_programs()))
+        app.state.background_tasks.append(asyncio.create_task(sync_price_board()))
+        app.state.background_tasks.append(asyncio.create_task(indicator_feed()))
+        return
+
+    app.state.historical.migrate_legacy('prices_historical.db')
+    app.state.board = PriceBoard(PRICE_BOARD, create=True)
+    load_price_store()
 
     # Run the price update and historical prices tasks.
-    app.state.price_update_task = asyncio.create_task(update_prices())
-    app.state.historical_prices_task = asyncio.create_task(historical_prices_manager())
+    app.state.background_tasks.append(asyncio.create_task(update_prices()))
+    app.state.background_tasks.append(asyncio.create_task(historical_prices_manager()))
+    app.state.background_tasks.append(asyncio.create_task(ingestion_heartbeat()))
+    app.state.background_tasks.append(asyncio.create_task(indicator_feed()))
 
 @app.on_event("shutdown")
 async def shutdown_event():
     # Gracefully cancel the tasks.
-    app.state.price_update_task.cancel()
-    app.state.historical_prices_task.cancel()
+    for task in app.state.background_tasks:task.cancel()
     try:
-        await app.state.price_update_task
-        await app.state.historical_prices_task
+        for task in app.state.background_tasks:await task
     except asyncio.CancelledError:
         pass
 
+MAX_REQUEST_INDICATORS = 8
+MAX_TIMEFRAME = 60*24 # minutes
+MAX_RANGE_BARS = 60*24*30 # a month of bars at the requested timeframe, fewer than an indicator series holds
+MAX_RANGE = 60*60*24*365 # seconds, whatever the timeframe
+
 @app.get("/historical_prices/{asset_id}/{pair}")
 async def get_historical_prices(request: Request, asset_id: int, pair: str, timeframe: int = 1):
     table = f'historical_prices_{asset_id}_{pair.replace("-", "_")}'
     if table not in app.state.valid_tables:return {'error': 'Invalid pair', 'endpoint': '/historical_prices'}
 
-    conn = sqlite3.connect(f'prices_historical.db')
-    cursor = conn.cursor()
+    # Optional indicators, e.g. ?indicators=sma:20,rsi:14,macd:12:26:9,bb:20:2 -- one extra column per indicator.
+    try:indicators = [parse_spec(spec) for spec in request.query_params.get('indicators', '').split(',') if spec.strip()]
+    except ValueError as e:return {'error': f'Invalid indicator: {e}', 'endpoint': '/historical_prices'}
+    if len(set(indicators)) > MAX_REQUEST_INDICATORS:return {'error': f'At most {MAX_REQUEST_INDICATORS} indicators per request', 'endpoint': '/historical_prices'}
+    if timeframe < 1 or timeframe > MAX_TIMEFRAME:return {'error': 'Invalid timeframe', 'endpoint': '/historical_prices'}
 
     from_timestamp = int(request.query_params.get('from', default=int(time.time()) - (60*60*6)))*1000
     to_timestamp = int(request.query_params.get('to',default=int(time.time())))*1000
@@ -301,11 +476,11 @@ async def get_historical_prices(request: Request, asset_id: int, pair: str, time
     if from_timestamp > to_timestamp:
         from_timestamp, to_timestamp = to_timestamp, from_timestamp
 
-    if from_timestamp-to_timestamp > (60*60*24*30)*1000: # 1 month in one query
+    if to_timestamp - from_timestamp > min(MAX_RANGE_BARS * timeframe * 60, MAX_RANGE) * 1000:
         return {'error': 'Time range too large', 'endpoint': '/historical_prices'}
 
-    cursor.execute(f'SELECT open, high, low, close, timestamp/1000 FROM {table} WHERE timestamp > ? AND timestamp < ? ORDER BY timestamp ASC', (from_timestamp, to_timestamp))
-    prices = cursor.fetchall()
+    # Only the monthly partitions overlapping the range are opened.
+    prices = app.state.historical.select(table, 'open, high, low, close, timestamp/1000', from_timestamp, to_timestamp)
 
     if timeframe > 1:
         candles = []
@@ -342,8 +517,20 @@ async def get_historical_prices(request: Request, asset_id: int, pair: str, time
     else:
         candles = prices
 
-    cursor.close()
-    conn.close()
+    if indicators and candles:
+        candles = [list(candle) for candle in candles]
+        for spec in indicators:
+            # Series kept live for /ws subscribers are reused and extended back to `from` when it is recent,
+            # anything else is a one-off build off the event loop that is not cached.
+            series_key = (asset_id, pair, timeframe, spec)
+            series = app.state.indicators.cached(*series_key, from_timestamp // 1000)
+            if series is None and app.state.indicators.is_cached(*series_key) and from_timestamp // 1000 >= int(time.time()) - CACHE_WINDOW:
+                await warm_indicator(series_key, min(from_timestamp // 1000, int(time.time()) - WARM_WINDOW))
+                series = app.state.indicators.cached(*series_key, from_timestamp // 1000)
+            if series is None:
+                series = await asyncio.get_running_loop().run_in_executor(None, app.state.indicators.build, *series_key, from_timestamp // 1000, to_timestamp // 1000)
+            for candle in candles:candle.append(series.value_at(candle[4]))
+
     return candles
 
 @app.get("/prices/{asset_id}/{pair}")
@@ -361,33 +548,38 @@ async def get_prices(asset_id: str, pair: str):
     conn.close()
     return prices
 
+# Both served from pre-encoded bytes kept current off the price board, see catalog.py.
 @app.get("/metadata/{asset_id}/{pair}")
-async def get_metadata(asset_id: int, pair: str):
+async def get_metadata(request: Request, asset_id: int, pair: str):
 
     table = f'metadata_{asset_id}_{pair.replace("-", "_")}'
     if table not in app.state.valid_tables:return {'error': 'Invalid pair', 'endpoint': '/metadata'}
 
-    conn = sqlite3.connect(f'prices.db')
-    cursor = conn.cursor()
-
-    table = f'prices_{asset_id}_{pair.replace("-", "_")}'
-
-    cursor.execute(f'SELECT * FROM {table} ORDER BY timestamp DESC LIMIT 1')
-    price_data = cursor.fetchone()
-
-    # known bug that if prices were completely flushed in a bar, these will not exist within prices table.
-    try:value = {'pair': price_data[0],'blockchain': price_data[3],'price': price_data[1]}
-    except:value = {'pair': pair,'blockchain': 'solana','price': None}
-
-    cursor.close()
-    conn.close()
-    return value
+    entry = app.state.catalog.metadata(asset_id, pair, app.state.board)
+    return entry_response(entry, request.headers.get('if-none-match'))
 
 @app.get('/assets')
-async def get_assets():
-    return app.state.programs
-
-async def handle_subscription_messages(websocket: WebSocket, subscribed_assets: set):
+async def get_assets(request: Request):
+    entry = app.state.catalog.assets(app.state.programs, app.state.programs_changed, app.state.board)
+    return entry_response(entry, request.headers.get('if-none-match'))
+
+@app.get('/metrics')
+async def get_metrics():
+    frames_handled = app.state.board.frames_handled() if app.state.board is not None else 0
+    return {'connections': len(active_connections), 'frames_handled': frames_handled} | send_metrics
+
+# 503 when the ingestion stopped beating, prices on the board are frozen then.
+@app.get('/health')
+async def get_health():
+    heartbeat = app.state.board.heartbeat() if app.state.board is not None else 0
+    age = time.time() - heartbeat / 1000 if heartbeat else None
+    if age is None or age > INGESTION_TIMEOUT:
+        return JSONResponse({'status': 'ingestion stalled', 'heartbeat_age': age}, status_code=503)
+    return {'status': 'ok', 'heartbeat_age': age}
+
+MAX_INDICATOR_SUBSCRIPTIONS = 32
+
+async def handle_subscription_messages(websocket: WebSocket, subscribed_assets: set, subscribed_indicators: dict):
     try:
         while True:
             message = await websocket.receive_json()
@@ -401,14 +593,33 @@ async def handle_subscription_messages(websocket: WebSocket, subscribed_assets:
                 if asset_id in subscribed_assets:
                     subscribed_assets.remove(asset_id)
 
+            elif message['type'] in ('subscribe_indicators', 'unsubscribe_indicators'): # e.g. {'asset_id': '1_WSOL_USDC', 'timeframe': 1, 'indicators': ['rsi:14']}
+                asset_id = message['asset_id'].replace('-', '_')
+                if asset_id not in app.state.series:continue
+                try:
+                    timeframe = int(message.get('timeframe', 1))
+                    specs = [parse_spec(spec) for spec in message['indicators']]
+                except (ValueError, TypeError):
+                    continue
+                if timeframe < 1 or timeframe > MAX_TIMEFRAME:continue
+
+                for spec in specs:
+                    key = (asset_id, timeframe, spec)
+                    if message['type'] == 'unsubscribe_indicators':
+                        subscribed_indicators.pop(key, None)
+                    elif key not in subscribed_indicators and len(subscribed_indicators) < MAX_INDICATOR_SUBSCRIPTIONS:
+                        subscribed_indicators[key] = None
+                        series_key = app.state.series[asset_id] + (timeframe, spec)
+                        if not app.state.indicators.is_cached(*series_key):warm_indicator(series_key) # from history, in the executor
+
     except WebSocketDisconnect:
         raise
     except Exception as e:
         raise
 
 
-async def send_price_updates(websocket: WebSocket, user_state: dict, user_tick_speed: float, subscribed_assets: set):
-    """Send price updates for subscribed assets"""
+async def send_price_updates(send_queue: ConflatingSendQueue, user_state: dict, user_tick_speed: float, subscribed_assets: set, subscribed_indicators: dict):
+    """Queue price updates for subscribed assets, the send queue delivers them at the client's pace"""
     try:
         def nested_dict():
             return defaultdict(nested_dict)
@@ -440,39 +651,29 @@ async def send_price_updates(websocket: WebSocket, user_state: dict, user_tick_s
                     historical_bar_minimum = 60
                     current_time = time.time()
                     this_bar_range = math.floor(current_time / historical_bar_minimum) * historical_bar_minimum
-                    bottom_timestamp = this_bar_range * 1000
-                    top_timestamp = (this_bar_range + historical_bar_minimum) * 1000
-
-                    
-                    conn = sqlite3.connect(f'prices.db')
-                    cursor = conn.cursor()
-
-                    cursor.execute(f'SELECT * FROM prices_{asset_id} WHERE timestamp >= ? AND timestamp < ? ORDER BY timestamp ASC', (bottom_timestamp, top_timestamp))
-                    
-                    prices_for_range = cursor.fetchall()
-                    cursor.close()
-                    conn.close()
-
-                    bars = {}
-                    for item in prices_for_range:
-                        if this_bar_range not in bars: # Create initial bar.
-                            bars[this_bar_range] = {
-                                'asset': asset_id,
-                                'bar': [item[1],item[1],item[1],item[1]], # OHLC all the same for initial bar.
-                                'timestamp': this_bar_range,
-                            }
-                        else: # Update the bar as it goes.
-                            bars[this_bar_range]['bar'][1] = max(bars[this_bar_range]['bar'][1], item[1])
-                            bars[this_bar_range]['bar'][2] = min(bars[this_bar_range]['bar'][2], item[1])
-                            bars[this_bar_range]['bar'][3] = item[1]
-                    
-
-                    if this_bar_range in bars: # Send the final bar to subscribed client
-                        bar = bars[this_bar_range]
-                        await websocket.send_json({'type': 'bars', 'data': bar})
-
-            # Send the price updates to the client.
-            if len(diff) > 0:await websocket.send_json({'type': 'prices', 'data': diff})
+
+                    # The open bar is kept up to date by the ingestion on the price board.
+                    board_entry = app.state.board.read(*app.state.series[asset_id])
+
+                    if board_entry is not None and board_entry['bar_timestamp'] == this_bar_range: # Send the current bar to subscribed client
+                        send_queue.put_bar({'asset': asset_id, 'bar': board_entry['bar'], 'timestamp': this_bar_range})
+
+            # Indicators are computed once per series by the engine, clients only pick up new values.
+            for key in list(subscribed_indicators):
+                asset_id, timeframe, spec = key
+                series_key = app.state.series[asset_id] + (timeframe, spec)
+                series = app.state.indicators.series.get(series_key)
+                if series is None: # still building, or evicted when the cache was full
+                    warm_indicator(series_key)
+                    continue
+                series.last_used = time.time()
+
+                if series.open_timestamp is not None and series.version != subscribed_indicators[key]:
+                    subscribed_indicators[key] = series.version
+                    send_queue.put_indicators({'asset': asset_id, 'timeframe': timeframe, 'indicator': spec} | series.latest())
+
+            # Queue the price updates for the client.
+            if len(diff) > 0:send_queue.put_prices(diff)
 
             await asyncio.sleep(user_tick_speed)
     except:raise
@@ -498,28 +699,48 @@ async def websocket_endpoint(websocket: WebSocket):
             else:cleaned_prices[program['asset_id']][pair] = None
 
     # Send the initial prices to the client.
-    await websocket.send_json({'type': 'prices', 'data': cleaned_prices})
+    send_queue = ConflatingSendQueue()
+    send_queue.put_prices(cleaned_prices)
 
     subscribed_assets = set()
+    subscribed_indicators = {} # (asset, timeframe, spec) -> last version sent
     try:
-        task = asyncio.create_task(handle_subscription_messages(websocket, subscribed_assets))
-        send_task = asyncio.create_task(send_price_updates(websocket, user_state, user_tick_speed, subscribed_assets))
-        await asyncio.gather(task,send_task)
+        task = asyncio.create_task(handle_subscription_messages(websocket, subscribed_assets, subscribed_indicators))
+        update_task = asyncio.create_task(send_price_updates(send_queue, user_state, user_tick_speed, subscribed_assets, subscribed_indicators))
+        send_task = asyncio.create_task(send_queue.run(websocket))
+        await asyncio.gather(task,update_task,send_task)
     except WebSocketDisconnect:
         pass
+    except SlowClient:
+        print("WebSocket client too slow, disconnecting")
+        try:await websocket.close(code=1013)
+        except:pass
     except Exception as e:
         traceback.print_exc()
     finally:
         active_connections.remove(websocket)
         task.cancel()
+        update_task.cancel()
         send_task.cancel()
 
-# Redirect to static frontend.
+# Redirect to static frontend. GET and HEAD are answered from memory by StaticAssetMiddleware before they get here.
 @app.get("/")
-async def index():return FileResponse("../frontend/build/index.html")
+async def index(request: Request):return app.state.static_assets.response(app.state.static_assets.index, request.headers)
 @app.get("/{full_path:path}")
-async def serve_app():return FileResponse("../frontend/build/index.html")
+async def serve_app(request: Request):return app.state.static_assets.response(app.state.static_assets.index, request.headers)
 
 if __name__ == "__main__":
-    uvicorn.run(app, host=ENV['HOST'], port=int(ENV['PORT']))
+    if WORKERS > 1:
+        # One supervised ingestion process feeds the price board, the uvicorn workers serve clients from it.
+        PriceBoard(PRICE_BOARD, create=True).close()
+        os.environ['PRICES_INGESTION'] = 'external'
+        stopping = threading.Event()
+        supervisor = threading.Thread(target=supervise_ingestion, args=(stopping,), name='ingestion-supervisor', daemon=True)
+        supervisor.start()
+        try:uvicorn.run("main:app", host=ENV['HOST'], port=int(ENV['PORT']), workers=WORKERS)
+        finally:
+            stopping.set()
+            supervisor.join(15)
+    else:
+        uvicorn.run(app, host=ENV['HOST'], port=int(ENV['PORT']))
 
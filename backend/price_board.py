@@ -0,0 +1,246 @@
+import os, mmap, math, time, struct
+from collections import deque
+
+# Shared-memory board of current prices and open 1m bars.
+# One ingestion process writes, any number of uvicorn workers read lock-free. The board is created
+# once, an ingestion process that is restarted opens it again without a reset.
+#
+# Layout (little endian):
+#   header: magic, version, capacity, count, generation, frames handled, heartbeat_ms -- padded to 64 bytes
+#   slot:   seq, name, price, updated_ms, bar_timestamp, open, high, low, close, high_24h, low_24h, ticks_24h -- padded to 160 bytes
+#
+# Each slot is guarded by a seqlock: the writer makes seq odd, writes, then makes it even again.
+# Readers retry if seq was odd or moved while they copied the slot. Since seq only ever moves on a
+# write it doubles as a version number for anything derived from the slot.
+#
+# The 24h high/low are NaN when nothing was seen in the last 24h.
+
+MAGIC = b'PBRD'
+VERSION = 4
+HEADER = struct.Struct('<4sIIIQQQ')
+HEADER_SIZE = 64
+SLOT = struct.Struct('<Q48sdqqddddddq')
+SLOT_SIZE = 160
+SEQ = struct.Struct('<Q')
+COUNT_OFFSET = 12
+FRAMES_OFFSET = 24
+HEARTBEAT_OFFSET = 32
+MAX_NAME_BYTES = 48 # 'asset_id/pair' in utf-8
+BAR_MINIMUM = 60 # seconds, same as the historical bars
+WINDOW_MINUTES = 60*24
+
+class RollingWindow:
+    """24h high, low and tick count over minute buckets, O(1) amortized per tick using monotonic deques."""
+
+    def __init__(self):
+        self.buckets = deque() # [minute, high, low, ticks]
+        self.highs = deque() # (minute, high), highs decreasing
+        self.lows = deque() # (minute, low), lows increasing
+        self.ticks = 0
+
+    def add(self, minute: int, high: float, low: float, ticks: int = 1):
+        if self.buckets and self.buckets[-1][0] == minute:
+            bucket = self.buckets[-1]
+            bucket[3] += ticks
+            if high > bucket[1]:
+                bucket[1] = high
+                while self.highs and self.highs[-1][1] <= high:self.highs.pop()
+                self.highs.append((minute, high))
+            if low < bucket[2]:
+                bucket[2] = low
+                while self.lows and self.lows[-1][1] >= low:self.lows.pop()
+                self.lows.append((minute, low))
+        elif not self.buckets or minute > self.buckets[-1][0]:
+            self.buckets.append([minute, high, low, ticks])
+            while self.highs and self.highs[-1][1] <= high:self.highs.pop()
+            self.highs.append((minute, high))
+            while self.lows and self.lows[-1][1] >= low:self.lows.pop()
+            self.lows.append((minute, low))
+        else:
+            return # older than what we have, only happens when seeding overlaps live ticks
+        self.ticks += ticks
+
+        self.advance(minute)
+
+    def advance(self, minute: int):
+        """Drop whatever fell out of the 24h before minute, also called without a tick so quiet series expire."""
+        while self.buckets and self.buckets[0][0] <= minute - WINDOW_MINUTES:self.ticks -= self.buckets.popleft()[3]
+        while self.highs and self.highs[0][0] <= minute - WINDOW_MINUTES:self.highs.popleft()
+        while self.lows and self.lows[0][0] <= minute - WINDOW_MINUTES:self.lows.popleft()
+
+    def stats(self) -> tuple[float, float, int]:
+        return self.highs[0][1], self.lows[0][1], self.ticks
+
+class PriceBoard:
+    def __init__(self, path: str, capacity: int = 4096, create: bool = False):
+        self.path = path
+        self.capacity = capacity
+        self.size = HEADER_SIZE + capacity * SLOT_SIZE
+
+        if create:
+            # Never shrink an existing file, readers that still map it would fault past EOF.
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+            if os.fstat(fd).st_size < self.size:os.ftruncate(fd, self.size)
+        else:
+            fd = os.open(path, os.O_RDWR)
+            self.capacity = HEADER.unpack(os.pread(fd, HEADER.size, 0))[2]
+            self.size = HEADER_SIZE + self.capacity * SLOT_SIZE
+
+        self.mm = mmap.mmap(fd, self.size)
+        os.close(fd)
+
+        self.index = {} # name -> slot
+        self.windows = {} # name -> RollingWindow, writer only
+        self.generation = None
+        if create:self.reset()
+        else:self.refresh_index()
+
+    def reset(self):
+        self.mm[:self.size] = bytes(self.size)
+        self.generation = time.time_ns()
+        HEADER.pack_into(self.mm, 0, MAGIC, VERSION, self.capacity, 0, self.generation, 0, 0)
+        self.index = {}
+        self.windows = {}
+
+    # Reader side.
+    def refresh_index(self):
+        magic, version, capacity, count, generation, _, _ = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise RuntimeError(f'{self.path} is not a price board (or is from another version)')
+
+        if generation != self.generation:
+            self.index = {}
+            self.generation = generation
+
+        for slot in range(len(self.index), count):
+            name = SLOT.unpack_from(self.mm, self.slot_offset(slot))[1].rstrip(b'\x00').decode('utf-8')
+            self.index[name] = slot
+
+    def slot_offset(self, slot: int) -> int:
+        return HEADER_SIZE + slot * SLOT_SIZE
+
+    def read_slot(self, slot: int, retries: int = 100):
+        offset = self.slot_offset(slot)
+        for _ in range(retries):
+            before = SEQ.unpack_from(self.mm, offset)[0]
+            if before & 1:continue
+            values = SLOT.unpack_from(self.mm, offset)
+            if SEQ.unpack_from(self.mm, offset)[0] == before:return values
+        return None
+
+    def read(self, asset_id, pair: str) -> dict | None:
+        """Current price, open bar and 24h stats for a series, or None if it was never written."""
+        self.refresh_index()
+        slot = self.index.get(f'{asset_id}/{pair}')
+        if slot is None:return None
+
+        values = self.read_slot(slot)
+        if values is None:return None
+        seq, _, price, updated_ms, bar_timestamp, bar_open, high, low, close, high_24h, low_24h, ticks_24h = values
+        return {
+            'version': seq,
+            'price': price,
+            'updated': updated_ms,
+            'bar_timestamp': bar_timestamp,
+            'bar': [bar_open, high, low, close],
+            'high_24h': high_24h,
+            'low_24h': low_24h,
+            'ticks_24h': ticks_24h,
+        }
+
+    def version(self, asset_id, pair: str) -> int:
+        """Seq of the slot, changes on every write and is 0 for series never written."""
+        self.refresh_index()
+        slot = self.index.get(f'{asset_id}/{pair}')
+        if slot is None:return 0
+        return SEQ.unpack_from(self.mm, self.slot_offset(slot))[0] & ~1
+
+    def frames_handled(self) -> int:
+        """RPC frames the ingestion has fully processed since the board was created."""
+        return SEQ.unpack_from(self.mm, FRAMES_OFFSET)[0]
+
+    def heartbeat(self) -> int:
+        """When the ingestion last said it was alive (ms), 0 if it never did."""
+        return SEQ.unpack_from(self.mm, HEARTBEAT_OFFSET)[0]
+
+    def prices(self):
+        """Yield (asset_id, pair, price, updated_ms) for every series on the board."""
+        self.refresh_index()
+        for name, slot in self.index.items():
+            values = self.read_slot(slot)
+            if values is None or values[3] == 0:continue
+            asset_id, pair = name.split('/', 1)
+            yield int(asset_id), pair, values[2], values[3]
+
+    # Writer side, only ever called from the ingestion process.
+    def assign_slot(self, name: str) -> int:
+        # struct would silently cut the name and readers would never find the series.
+        if len(name.encode('utf-8')) > MAX_NAME_BYTES:raise ValueError(f'{name} is longer than {MAX_NAME_BYTES} bytes')
+        count = HEADER.unpack_from(self.mm, 0)[3]
+        if count >= self.capacity:raise RuntimeError(f'price board is full ({self.capacity} series)')
+
+        # The name is written before count moves so readers never index a half written slot.
+        SLOT.pack_into(self.mm, self.slot_offset(count), 0, name.encode('utf-8'), 0.0, 0, 0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0)
+        struct.pack_into('<I', self.mm, COUNT_OFFSET, count + 1)
+        self.index[name] = count
+        self.windows[name] = RollingWindow()
+        return count
+
+    def set_frames_handled(self, frames: int):
+        SEQ.pack_into(self.mm, FRAMES_OFFSET, frames)
+
+    def beat(self):
+        SEQ.pack_into(self.mm, HEARTBEAT_OFFSET, int(time.time() * 1000))
+
+    def seed_window(self, asset_id, pair: str, bars: list):
+        """Prime the 24h stats from (timestamp ms, high, low, ticks) in timestamp order, ticks is None for bars stored before they were counted."""
+        name = f'{asset_id}/{pair}'
+        if name not in self.index:self.assign_slot(name)
+        window = self.windows.setdefault(name, RollingWindow()) # slots survive an ingestion restart, windows do not
+        for timestamp, high, low, ticks in bars:
+            window.add(timestamp // 1000 // 60, high, low, ticks or 0)
+
+    def write(self, asset_id, pair: str, price: float, timestamp: int, bar: bool = True):
+        """Publish a price (timestamp in ms) and fold it into the open bar and 24h stats unless bar is False."""
+        name = f'{asset_id}/{pair}'
+        slot = self.index.get(name)
+        if slot is None:slot = self.assign_slot(name)
+
+        offset = self.slot_offset(slot)
+        seq, raw_name, _, _, bar_timestamp, bar_open, high, low, close, _, _, _ = SLOT.unpack_from(self.mm, offset)
+
+        window = self.windows.setdefault(name, RollingWindow())
+        if bar:
+            this_bar = (timestamp // 1000) // BAR_MINIMUM * BAR_MINIMUM
+            if this_bar != bar_timestamp:
+                bar_timestamp, bar_open, high, low, close = this_bar, price, price, price, price
+            else:
+                high, low, close = max(high, price), min(low, price), price
+            window.add(timestamp // 1000 // 60, price, price)
+        high_24h, low_24h, ticks_24h = window.stats() if window.buckets else (math.nan, math.nan, 0)
+
+        SEQ.pack_into(self.mm, offset, seq + 1)
+        SLOT.pack_into(self.mm, offset, seq + 1, raw_name, price, timestamp, bar_timestamp, bar_open, high, low, close, high_24h, low_24h, ticks_24h)
+        SEQ.pack_into(self.mm, offset, seq + 2)
+
+    def advance_windows(self, timestamp: int):
+        """Expire the 24h stats of every series up to timestamp (ms) and republish the slots whose stats moved."""
+        minute = timestamp // 1000 // 60
+        for name, slot in self.index.items():
+            window = self.windows.get(name)
+            if window is None:continue
+            window.advance(minute)
+
+            offset = self.slot_offset(slot)
+            seq, raw_name, price, updated, bar_timestamp, bar_open, high, low, close, high_24h, low_24h, ticks_24h = SLOT.unpack_from(self.mm, offset)
+            if updated == 0:continue
+            if not window.buckets and math.isnan(high_24h):continue # already published as empty
+            stats = window.stats() if window.buckets else (math.nan, math.nan, 0)
+            if stats == (high_24h, low_24h, ticks_24h):continue
+
+            SEQ.pack_into(self.mm, offset, seq + 1)
+            SLOT.pack_into(self.mm, offset, seq + 1, raw_name, price, updated, bar_timestamp, bar_open, high, low, close, *stats)
+            SEQ.pack_into(self.mm, offset, seq + 2)
+
+    def close(self):
+        self.mm.close()
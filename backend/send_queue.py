@@ -0,0 +1,84 @@
+import asyncio
+
+# Per-connection outbound queue for /ws.
+#
+# Only the latest price per series and the latest version of each open bar (and indicator value)
+# are kept, so a slow client costs at most one entry per series no matter how far behind it is.
+# Superseded prices are dropped and updates for the same bar are merged into the newest one.
+
+SEND_TIMEOUT = 2 # seconds a single frame may take before the client counts as slow
+MAX_SEND_TIMEOUTS = 3 # consecutive slow sends before the client is disconnected
+MAX_PENDING_FRAMES = 256 # keyed frames (bars, indicators), oldest ones go first past this
+
+# Counters for every connection in this process, served on /metrics.
+metrics = {
+    'frames_sent': 0,
+    'prices_dropped': 0,
+    'frames_conflated': 0,
+    'frames_dropped': 0,
+    'send_timeouts': 0,
+    'slow_disconnects': 0,
+}
+
+class SlowClient(Exception):
+    pass
+
+class ConflatingSendQueue:
+    def __init__(self):
+        self.prices = {} # asset_id -> {pair: price}
+        self.frames = {} # (type, key...) -> data, for bars and indicators
+        self.ready = asyncio.Event()
+        self.timeouts = 0
+
+    def put_prices(self, diff: dict):
+        for asset_id, pairs in diff.items():
+            pending = self.prices.setdefault(asset_id, {})
+            for pair, price in pairs.items():
+                if pair in pending:metrics['prices_dropped'] += 1
+                pending[pair] = price
+        self.ready.set()
+
+    def put_bar(self, bar: dict):
+        self.put_frame(('bars', bar['asset'], bar['timestamp']), bar)
+
+    def put_indicators(self, indicators: dict):
+        # Each frame carries the last committed value too, so only the newest one per series matters.
+        self.put_frame(('indicators', indicators['asset'], indicators['timeframe'], indicators['indicator']), indicators)
+
+    def put_frame(self, key: tuple, data: dict):
+        if key in self.frames:
+            metrics['frames_conflated'] += 1
+            del self.frames[key] # re-insert so the dict stays in arrival order
+        elif len(self.frames) >= MAX_PENDING_FRAMES:
+            del self.frames[next(iter(self.frames))]
+            metrics['frames_dropped'] += 1
+        self.frames[key] = data
+        self.ready.set()
+
+    def drain(self) -> list[dict]:
+        """Take everything pending as the list of frames to send, bars first like before."""
+        messages = [{'type': key[0], 'data': data} for key, data in self.frames.items()]
+        if self.prices:messages.append({'type': 'prices', 'data': self.prices})
+        self.prices = {}
+        self.frames = {}
+        self.ready.clear()
+        return messages
+
+    async def send(self, websocket, message: dict):
+        try:
+            await asyncio.wait_for(websocket.send_json(message), SEND_TIMEOUT)
+            self.timeouts = 0
+            metrics['frames_sent'] += 1
+        except asyncio.TimeoutError:
+            metrics['send_timeouts'] += 1
+            self.timeouts += 1
+            if self.timeouts >= MAX_SEND_TIMEOUTS:
+                metrics['slow_disconnects'] += 1
+                raise SlowClient()
+
+    async def run(self, websocket):
+        """Send whatever is pending whenever the socket is free, until the client disconnects or is too slow."""
+        while True:
+            await self.ready.wait()
+            for message in self.drain():
+                await self.send(websocket, message)
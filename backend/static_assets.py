@@ -0,0 +1,213 @@
+import os, gzip, asyncio, hashlib, mimetypes, traceback
+
+from starlette.datastructures import Headers
+from starlette.responses import Response
+from starlette.routing import Match
+
+try:import brotli
+except ImportError:brotli = None # gzip only
+
+try:import fcntl
+except ImportError:fcntl = None # no lock, each worker may compress a file the others are compressing too
+
+# The frontend build served from memory.
+#
+# Every file is read once and compressed once (gzip and brotli) at startup, then requests only
+# pick the right pre-encoded bytes. Hashed files under /static never change so they are cached
+# forever, everything else is revalidated with its ETag. Reading and compressing runs in an
+# executor, never on the event loop, and a new build is only picked up once it stopped changing.
+#
+# Compressed bodies are also kept on disk by content hash. Workers load the build one at a time,
+# so with several of them only the first compresses and the others read what it wrote.
+
+COMPRESSIBLE = ('text/', 'application/javascript', 'application/json', 'application/manifest+json', 'image/svg+xml', 'image/x-icon', 'image/vnd.microsoft.icon')
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'no-cache'
+RELOAD_CHECK_SECONDS = 5 # a changed build is loaded once it looked the same on two checks in a row
+
+class Asset:
+    def __init__(self, path: str, body: bytes, cache_control: str, cache_directory: str = None):
+        self.content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        if self.content_type.startswith('text/') or self.content_type in ('application/javascript', 'application/json', 'application/manifest+json'):
+            self.content_type += '; charset=utf-8'
+        self.cache_control = cache_control
+
+        digest = hashlib.sha256(body).hexdigest()[:32]
+        self.bodies = {'identity': body}
+        self.etags = {'identity': f'"{digest}"'}
+
+        # Only keep encodings that actually save something.
+        if self.content_type.startswith(COMPRESSIBLE):
+            compressors = {'gzip': lambda: gzip.compress(body, compresslevel=9, mtime=0)}
+            # Source maps are only fetched by devtools, brotli at quality 11 is not worth seconds per map.
+            if brotli is not None and not path.endswith('.map'):compressors['br'] = lambda: brotli.compress(body, quality=11)
+            for encoding, compress in compressors.items():
+                data = cached_compress(cache_directory, f'{digest}.{encoding}', compress)
+                if len(data) < len(body) * 0.95:
+                    self.bodies[encoding] = data
+                    self.etags[encoding] = f'"{digest}-{encoding}"'
+
+def cached_compress(cache_directory: str | None, name: str, compress) -> bytes:
+    """compress() once, reusing what an earlier load (or another worker) left in cache_directory."""
+    if cache_directory is None:return compress()
+    cache_path = os.path.join(cache_directory, name)
+    try:
+        with open(cache_path, 'rb') as file:return file.read()
+    except OSError:
+        pass
+
+    data = compress()
+    try:
+        with open(f'{cache_path}.{os.getpid()}.tmp', 'wb') as file:file.write(data)
+        os.replace(f'{cache_path}.{os.getpid()}.tmp', cache_path) # never a partial file under the real name
+    except OSError:
+        traceback.print_exc()
+    return data
+
+def accepted_encodings(accept_encoding: str) -> dict:
+    """Parse Accept-Encoding into {coding: q}."""
+    accepted = {}
+    for item in accept_encoding.split(','):
+        coding, *params = [part.strip() for part in item.split(';')]
+        if not coding:continue
+        q = 1.0
+        for param in params:
+            if param.startswith('q='):
+                try:q = float(param[2:])
+                except ValueError:q = 0.0
+        accepted[coding.lower()] = q
+    return accepted
+
+class StaticAssets:
+    """The build in memory. Empty until load() is awaited, which main.py does on startup."""
+
+    def __init__(self, directory: str, cache_directory: str = None):
+        self.directory = directory
+        self.cache_directory = cache_directory # compressed bodies shared between workers and restarts, None to keep them in memory only
+        self.assets = {}
+        self.index = None
+        self.signature = None # scan() of the build that is loaded
+        self.pending = None # scan() of a changed build seen on the last check
+
+    def scan(self) -> tuple:
+        """Path, size and mtime of every file in the build, cheap enough to poll."""
+        files = []
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                full_path = os.path.join(root, name)
+                try:stat = os.stat(full_path)
+                except OSError:continue # removed while we walked, the next check will see it
+                files.append((full_path, stat.st_size, stat.st_mtime_ns))
+        return tuple(sorted(files))
+
+    def read(self) -> tuple[dict, tuple]:
+        """Read and compress the whole build. Slow, only ever called in an executor."""
+        if self.cache_directory is None:return self.read_build()
+
+        os.makedirs(self.cache_directory, exist_ok=True)
+        with open(os.path.join(self.cache_directory, '.lock'), 'w') as lock:
+            if fcntl is not None:fcntl.flock(lock, fcntl.LOCK_EX) # released when the file is closed
+            assets, signature = self.read_build()
+
+            # Drop what older builds left behind.
+            digests = {asset.etags['identity'].strip('"') for asset in assets.values()}
+            for name in os.listdir(self.cache_directory):
+                if name != '.lock' and name.split('.', 1)[0] not in digests:
+                    try:os.remove(os.path.join(self.cache_directory, name))
+                    except OSError:pass
+        return assets, signature
+
+    def read_build(self) -> tuple[dict, tuple]:
+        signature = self.scan()
+        assets = {}
+        for full_path, _, _ in signature:
+            url_path = '/' + os.path.relpath(full_path, self.directory).replace(os.sep, '/')
+            cache_control = IMMUTABLE if url_path.startswith('/static/') else REVALIDATE
+            try:assets[url_path] = Asset(full_path, open(full_path, 'rb').read(), cache_control, self.cache_directory)
+            except OSError:continue
+        return assets, signature
+
+    async def load(self):
+        assets, signature = await asyncio.get_running_loop().run_in_executor(None, self.read)
+        if '/index.html' not in assets and self.index is not None:
+            print('The frontend build has no index.html, keeping the one in memory.')
+            self.signature = signature
+            return
+
+        # Swapped without an await in between, so a request never mixes two builds.
+        self.assets, self.index, self.signature = assets, assets.get('/index.html'), signature
+        print(f'Loaded {len(assets)} frontend files into memory.')
+
+    async def watch(self):
+        """Pick up a rebuilt frontend without a restart, once it stopped changing."""
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(RELOAD_CHECK_SECONDS)
+            try:
+                signature = await loop.run_in_executor(None, self.scan)
+                if signature == self.signature:
+                    self.pending = None
+                elif signature != self.pending:
+                    self.pending = signature # still being written, or just finished, look again next time
+                else:
+                    self.pending = None
+                    await self.load()
+            except asyncio.CancelledError:
+                raise
+            except:
+                traceback.print_exc()
+
+    def lookup(self, path: str) -> Asset | None:
+        return self.assets.get(path)
+
+    def response(self, asset: Asset, headers: Headers) -> Response:
+        accepted = accepted_encodings(headers.get('accept-encoding', ''))
+        encoding = 'identity'
+        for candidate in ('br', 'gzip'):
+            if candidate in asset.bodies and accepted.get(candidate, accepted.get('*', 0)) > 0:
+                encoding = candidate
+                break
+
+        response_headers = {'ETag': asset.etags[encoding], 'Cache-Control': asset.cache_control, 'Vary': 'Accept-Encoding'}
+        if encoding != 'identity':response_headers['Content-Encoding'] = encoding
+
+        # Any encoding of the same bytes is still the same file for the client.
+        if_none_match = headers.get('if-none-match')
+        if if_none_match is not None:
+            tags = {tag.strip().removeprefix('W/') for tag in if_none_match.split(',')}
+            if '*' in tags or tags & set(asset.etags.values()):
+                response_headers.pop('Content-Encoding', None)
+                return Response(status_code=304, headers=response_headers)
+
+        return Response(asset.bodies[encoding], headers=response_headers, media_type=asset.content_type)
+
+class StaticAssetMiddleware:
+    """Answers frontend requests from memory before they reach the gzip middleware or the routes.
+
+    Files in the build are served by path, and any GET that would only have matched one of the
+    `spa_routes` (the single-page app fallbacks) gets index.html.
+    """
+
+    def __init__(self, app, assets: StaticAssets, spa_routes: set):
+        self.app = app
+        self.assets = assets
+        self.spa_routes = spa_routes
+
+    def is_spa_route(self, scope) -> bool:
+        # The fallback routes are GET only, HEAD would only match them partially.
+        if scope['method'] == 'HEAD':scope = dict(scope, method='GET')
+        for route in scope['app'].router.routes:
+            if route.matches(scope)[0] == Match.FULL:
+                return getattr(route, 'name', None) in self.spa_routes
+        return False
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http' and scope['method'] in ('GET', 'HEAD'):
+            asset = self.assets.lookup(scope['path'])
+            if asset is None and not scope['path'].startswith('/static/') and self.is_spa_route(scope):
+                asset = self.assets.index
+            if asset is not None:
+                response = self.assets.response(asset, Headers(scope=scope))
+                await response(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
@@ -0,0 +1,4 @@
+import os, sys
+
+# The backend modules are imported as top level modules, like main.py does from backend/.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,68 @@
+import os, sqlite3
+from datetime import datetime, timezone
+
+import pytest
+
+from historical_store import HistoricalStore, month_bounds
+
+TABLE = 'historical_prices_1_SOL_USDC'
+
+def ms(*date):
+    return int(datetime(*date, tzinfo=timezone.utc).timestamp() * 1000)
+
+def bar(timestamp, price, ticks=1):
+    return {'pair': 'SOL-USDC', 'high': price, 'low': price, 'open': price, 'close': price, 'timestamp': timestamp, 'ticks': ticks}
+
+@pytest.fixture
+def store(tmp_path):
+    return HistoricalStore(str(tmp_path / 'historical'))
+
+def test_month_bounds_across_the_year_end():
+    assert month_bounds(ms(2023, 12, 31, 23, 59)) == ('2023_12', ms(2023, 12, 1), ms(2024, 1, 1))
+    assert month_bounds(ms(2024, 1, 1)) == ('2024_01', ms(2024, 1, 1), ms(2024, 2, 1))
+    assert month_bounds(ms(2024, 1, 1) - 1)[0] == '2023_12'
+
+def test_select_spans_partitions_in_order(store):
+    # Written newest month first, read back oldest first.
+    store.upsert_bars(TABLE, [bar(ms(2024, 1, 1, 0, 1), 3.0), bar(ms(2024, 1, 1), 2.0)])
+    store.upsert_bars(TABLE, [bar(ms(2023, 12, 31, 23, 59), 1.0)])
+
+    assert [partition[0] for partition in store.overlapping(ms(2023, 12, 31), ms(2024, 1, 2))] == ['2023_12', '2024_01']
+    assert [partition[0] for partition in store.overlapping(ms(2024, 1, 1), ms(2024, 1, 2))] == ['2024_01']
+
+    rows = store.select(TABLE, 'timestamp, close', ms(2023, 12, 31), ms(2024, 1, 2))
+    assert rows == [(ms(2023, 12, 31, 23, 59), 1.0), (ms(2024, 1, 1), 2.0), (ms(2024, 1, 1, 0, 1), 3.0)]
+    assert store.select(TABLE, 'timestamp', ms(2024, 1, 1), ms(2024, 1, 2)) == [(ms(2024, 1, 1, 0, 1),)]
+    assert store.select(TABLE, 'timestamp', ms(2024, 1, 1), ms(2024, 1, 2), inclusive=True) == [(ms(2024, 1, 1),), (ms(2024, 1, 1, 0, 1),)]
+    assert store.select('historical_prices_2_SOL_USDC', 'timestamp', ms(2023, 12, 31), ms(2024, 1, 2)) == []
+
+def test_upsert_merges_into_an_existing_bar(store):
+    timestamp = ms(2024, 1, 1)
+    store.upsert_bars(TABLE, [{'pair': 'SOL-USDC', 'high': 2.0, 'low': 1.0, 'open': 1.5, 'close': 1.8, 'timestamp': timestamp, 'ticks': 3}])
+    store.upsert_bars(TABLE, [{'pair': 'SOL-USDC', 'high': 2.5, 'low': 1.2, 'open': 2.4, 'close': 2.1, 'timestamp': timestamp, 'ticks': 2}])
+
+    assert store.select(TABLE, 'open, high, low, close, ticks', timestamp, timestamp + 1, inclusive=True) == [(1.5, 2.5, 1.0, 1.8, 5)]
+
+def test_migrate_legacy_reruns_after_a_crash(store, tmp_path):
+    legacy_path = str(tmp_path / 'prices_historical.db')
+    legacy = sqlite3.connect(legacy_path)
+    legacy.execute(f'CREATE TABLE {TABLE} (pair TEXT, high REAL, low REAL, open REAL, close REAL, timestamp INTEGER)')
+    timestamps = [ms(2023, 12, 31, 23, 58), ms(2023, 12, 31, 23, 59), ms(2024, 1, 1), ms(2024, 1, 1, 0, 1)]
+    legacy.executemany(f'INSERT INTO {TABLE} VALUES (?, ?, ?, ?, ?, ?)', [('SOL-USDC', 1.0, 1.0, 1.0, 1.0, timestamp) for timestamp in timestamps])
+    legacy.commit()
+    legacy.close()
+
+    # A first run that died after renaming the months into place but before setting the old file aside,
+    # and left a half written month behind.
+    store.migrate_legacy(legacy_path)
+    os.rename(f'{legacy_path}.migrated', legacy_path)
+    with open(f'{store.path("2024_01")}.migrating', 'wb') as leftover:leftover.write(b'partial')
+
+    store.migrate_legacy(legacy_path)
+
+    assert not [name for name in os.listdir(store.directory) if name.endswith('.migrating')]
+    assert not os.path.exists(legacy_path) and os.path.exists(f'{legacy_path}.migrated')
+    assert [partition[0] for partition in store.partitions] == ['2023_12', '2024_01']
+    assert [row[0] for row in store.select(TABLE, 'timestamp', 0, ms(2025, 1, 1))] == timestamps
+
+    store.migrate_legacy(legacy_path) # nothing left to migrate
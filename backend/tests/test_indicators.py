@@ -0,0 +1,122 @@
+import math, random
+
+import pytest
+
+import indicators
+from indicators import SMA, EMA, RSI, MACD, Bollinger, IndicatorEngine, IndicatorSeries, parse_spec
+
+# Straightforward reference implementations over the whole list of closes.
+
+def reference_sma(closes, period):
+    return [None if i + 1 < period else sum(closes[i + 1 - period:i + 1]) / period for i in range(len(closes))]
+
+def reference_ema(closes, period):
+    values, ema, alpha = [], None, 2 / (period + 1)
+    for i, close in enumerate(closes):
+        if i + 1 == period:ema = sum(closes[:period]) / period
+        elif ema is not None:ema = ema + alpha * (close - ema)
+        values.append(ema)
+    return values
+
+def reference_rsi(closes, period):
+    values, average_gain, average_loss = [None], None, None
+    changes = [closes[i] - closes[i - 1] for i in range(1, len(closes))]
+    for i, change in enumerate(changes):
+        if i + 1 < period:
+            values.append(None)
+            continue
+        if i + 1 == period:
+            average_gain = sum(max(c, 0) for c in changes[:period]) / period
+            average_loss = sum(max(-c, 0) for c in changes[:period]) / period
+        else:
+            average_gain = (average_gain * (period - 1) + max(change, 0)) / period
+            average_loss = (average_loss * (period - 1) + max(-change, 0)) / period
+        values.append(100.0 if average_loss == 0 else 100 - 100 / (1 + average_gain / average_loss))
+    return values
+
+def reference_macd(closes, fast, slow, signal):
+    fast_values, slow_values = reference_ema(closes, fast), reference_ema(closes, slow)
+    lines = [f - s if f is not None and s is not None else None for f, s in zip(fast_values, slow_values)]
+    defined = [line for line in lines if line is not None]
+    signals = iter(reference_ema(defined, signal))
+    values = []
+    for line in lines:
+        if line is None:
+            values.append(None)
+            continue
+        signal_value = next(signals)
+        values.append([line, signal_value, line - signal_value if signal_value is not None else None])
+    return values
+
+def reference_bollinger(closes, period, deviations):
+    values = []
+    for i in range(len(closes)):
+        if i + 1 < period:
+            values.append(None)
+            continue
+        window = closes[i + 1 - period:i + 1]
+        mean = sum(window) / period
+        deviation = math.sqrt(sum((close - mean) ** 2 for close in window) / period)
+        values.append([mean, mean + deviations * deviation, mean - deviations * deviation])
+    return values
+
+def assert_close(actual, expected):
+    assert len(actual) == len(expected)
+    for a, e in zip(actual, expected):
+        if isinstance(e, list):
+            assert isinstance(a, list)
+            for x, y in zip(a, e):
+                if y is None:assert x is None
+                else:assert x == pytest.approx(y, rel=1e-9, abs=1e-9)
+        elif e is None:assert a is None
+        else:assert a == pytest.approx(e, rel=1e-9, abs=1e-9)
+
+@pytest.fixture
+def closes():
+    rng = random.Random(7)
+    price, values = 100.0, []
+    for _ in range(300):
+        price = max(1.0, price + rng.uniform(-2, 2))
+        values.append(price)
+    return values
+
+@pytest.mark.parametrize('indicator, reference', [
+    (lambda: SMA(20), lambda closes: reference_sma(closes, 20)),
+    (lambda: EMA(20), lambda closes: reference_ema(closes, 20)),
+    (lambda: RSI(14), lambda closes: reference_rsi(closes, 14)),
+    (lambda: MACD(12, 26, 9), lambda closes: reference_macd(closes, 12, 26, 9)),
+    (lambda: Bollinger(20, 2), lambda closes: reference_bollinger(closes, 20, 2)),
+])
+def test_matches_reference(indicator, reference, closes):
+    instance = indicator()
+    previews, updates = [], []
+    for close in closes:
+        previews.append(instance.preview(close))
+        updates.append(instance.update(close))
+
+    assert_close(updates, reference(closes))
+    assert_close(previews, updates) # preview never moves the state
+
+def test_open_bar_does_not_commit(closes):
+    series = IndicatorSeries('sma:5', 1)
+    for i, close in enumerate(closes[:10]):series.on_bar(i * 60, close)
+    series.on_bar(9 * 60, 1000.0) # the open bar changes, nothing is committed
+    assert series.timestamps == [i * 60 for i in range(9)]
+    assert series.value_at(9 * 60) == pytest.approx((sum(closes[5:9]) + 1000.0) / 5)
+    assert series.value_at(8 * 60) == pytest.approx(sum(closes[4:9]) / 5)
+
+def test_parse_spec():
+    assert parse_spec('MACD') == 'macd:12:26:9'
+    assert parse_spec(' bb:10 ') == 'bb:10:2'
+    for spec in ('foo:1', 'sma:0', 'sma:1001', 'rsi:14:2'):
+        with pytest.raises(ValueError):parse_spec(spec)
+
+def test_cache_is_bounded_by_total_bars(monkeypatch):
+    monkeypatch.setattr(indicators, 'MAX_TOTAL_BARS', 25)
+    engine = IndicatorEngine(historical=None)
+    for period in range(1, 6):
+        series = IndicatorSeries(f'sma:{period}', 1)
+        for i in range(11):series.on_bar(i * 60, 1.0) # 10 committed bars each
+        engine.series[(1, 'A-B', 1, series.spec)] = series
+    engine.trim()
+    assert list(engine.series) == [(1, 'A-B', 1, 'sma:4'), (1, 'A-B', 1, 'sma:5')]